@@ -18,23 +18,33 @@ from logging import getLogger
 from os import environ, makedirs
 from pathlib import Path
 from collections import namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+from operator import itemgetter
 from shutil import get_terminal_size
+from sys import maxunicode
+from threading import Lock
 
-from sqlalchemy.sql import exists, func, or_
-from sqlalchemy.orm import aliased
+from sqlalchemy.sql import func, and_, or_, select
+from sqlalchemy.orm import aliased, sessionmaker
 
 from .models import (
-    SessionMaker, get_or_create,
-    File, Language, PartOfSpeech, Dictionary, Format,
+    Engine, has_profiles, get_or_create, has_trigram_index, generation,
+    File, Language, PartOfSpeech, Dictionary, Format, Statistic,
+    Word as WordModel,
+    TRIGRAM, TRIGRAM_VOCAB, TRIGRAM_MINIMUM, oriented,
 )
-from .formats import FORMATS
+from .formats import FORMATS, PART
+from .transliterate import fold
+from . import native
 
 logger = getLogger(__name__)
 
 DATA = Path(environ.get('HOME', '.')) / '.vortaro'
 DATABASE = 'sqlite:///%s/vortaro.sqlite' % DATA
 COLUMNS, ROWS = get_terminal_size((80, 20))
-CHUNKSIZE = 100000
+CHUNKSIZE = 10000
+SAMPLE = 1000
 
 def Word(x):
     illegal = set('\t\n\r')
@@ -43,6 +53,460 @@ def Word(x):
     else:
         return x
 
+def _stale_files(session, refresh, format_name, directory):
+    for path in directory.iterdir():
+        if path.is_file() and path.suffix != PART:
+            format = get_or_create(session, Format, name=format_name)
+            file = get_or_create(session, File, path=str(path), format=format)
+            if refresh or file.out_of_date:
+                yield file
+
+def _update(session, chunksize, jobs, refresh, files):
+    if 1 < jobs:
+        from . import parallel
+        parallel.update(session, list(files), chunksize, jobs, refresh)
+    else:
+        for file in files:
+            file.update(FORMATS[file.format.name].read, session, chunksize, refresh)
+            logger.info('Indexed %s\n' % file.path)
+
+MATCHES = ('contains', 'exact', 'prefix', 'suffix')
+ENGINES = ('sql', 'native')
+
+def _search_query(session, from_langs, to_langs, text, match='contains',
+                  trigram=False):
+    '''
+    Query for the definitions that match a search, each translation found
+    from either of its sides and turned to read from that side
+
+    :returns: The query, the selectable from :py:func:`oriented` that it
+        reads from and the aliases of :py:class:`Language` for the from- and
+        to-languages
+    '''
+    if match not in MATCHES:
+        raise ValueError('match must be one of: %s' % ', '.join(MATCHES))
+    key = fold(text)
+
+    def where(word):
+        conditions = []
+        if from_langs:
+            conditions.append(word.c.lang_id.in_(
+                select([Language.id]).where(Language.code.in_(from_langs))))
+        if match == 'exact':
+            conditions.append(or_(
+                word.c.roman_key == key,
+                word.c.key == key,
+            ))
+        elif match == 'prefix':
+            conditions.append(or_(
+                _starts_with(word.c.roman_key, key),
+                _starts_with(word.c.key, key),
+            ))
+        elif match == 'suffix':
+            conditions.append(or_(
+                _starts_with(word.c.roman_key_reversed, key[::-1]),
+                _starts_with(word.c.key_reversed, key[::-1]),
+            ))
+        else:
+            if TRIGRAM_MINIMUM <= len(key) and trigram:
+                # The trigram index finds candidates, and the LIKE below
+                # checks them.
+                conditions.append(word.c.id.in_(_trigram_words(key)))
+            conditions.append(or_(
+                word.c.roman_key.contains(key, autoescape=True),
+                word.c.key.contains(key, autoescape=True),
+            ))
+        return and_(*conditions)
+
+    # Main search query
+    Definition = oriented(where, to_langs)
+    ToLanguage = aliased(Language)
+    FromLanguage = aliased(Language)
+    q = session.query(Definition) \
+        .join(FromLanguage, Definition.c.from_lang_id == FromLanguage.id) \
+        .join(ToLanguage,   Definition.c.to_lang_id   == ToLanguage.id)
+    return q, Definition, FromLanguage, ToLanguage
+
+# Orders of results, as fields of vortaro.native.FIELDS or lengths:
+# from_length is the length of the word, and length that of the word and
+# its translation together. Searches of the database order by these
+# columns, and native searches sort by them and then by the languages, so
+# that ties come out the same every time. Python compares text by code
+# point, as SQLite does by default, so the two orders are the same only on
+# databases that compare text that way; PostgreSQL sorts by the collation
+# of the database.
+SEARCH_ORDER = ('from_length', 'part_of_speech', 'from_word', 'to_word')
+
+def _order_by(order, Definition):
+    '''
+    :param order: Names of the fields to order by
+    :param Definition: Selectable from :py:func:`vortaro.models.oriented`,
+        joined to :py:class:`PartOfSpeech`
+    :returns: Expressions to order a query by
+    '''
+    columns = {
+        'from_length': Definition.c.from_length,
+        'length': Definition.c.from_length + Definition.c.to_length,
+        'part_of_speech': PartOfSpeech.text,
+        'from_word': Definition.c.from_original,
+        'to_word': Definition.c.to_word,
+    }
+    return [columns[name] for name in order]
+
+_LENGTHS = {
+    'from_length': lambda row: len(row[2]),
+    'length': lambda row: len(row[2]) + len(row[5]),
+}
+
+def _sort_key(order):
+    '''
+    :param order: Names of the fields to order by
+    :returns: Sort key for rows from
+        :py:meth:`vortaro.native.NativeIndex.search` in the order that
+        :py:func:`_order_by` gives the database, then by the languages
+    '''
+    keys = [_LENGTHS[name] if name in _LENGTHS else
+            itemgetter(native.FIELDS.index(name)) for name in order] + \
+        [itemgetter(native.FIELDS.index(name)) for name in ('from_lang', 'to_lang')]
+    def key(row):
+        return tuple(k(row) for k in keys)
+    return key
+
+_native_order = _sort_key(SEARCH_ORDER)
+
+def _write_native(session, engine, data_dir):
+    '''
+    Write the native search file if it is wanted or already there, so that
+    it stays in step with the database
+    '''
+    path = data_dir / native.FILENAME
+    if engine == 'native' or path.exists():
+        native.write(session, path)
+
+def _trigram_words(text):
+    '''
+    Ids of the words with all of the trigrams of the text
+    '''
+    phrase = '"%s"' % text.replace('"', '""')
+    return select([TRIGRAM.c.rowid]).where(TRIGRAM.c.word_trigram.match(phrase))
+
+def _language_pairs(session):
+    FromLanguage = aliased(Language)
+    ToLanguage = aliased(Language)
+    return session.query(Statistic) \
+        .join(FromLanguage, Statistic.from_lang_id == FromLanguage.id) \
+        .join(ToLanguage,   Statistic.to_lang_id   == ToLanguage.id) \
+        .with_entities(FromLanguage.code, ToLanguage.code).distinct()
+
+def _estimate(session, q, text, match, trigram=False,
+              from_langs=(), to_langs=()):
+    '''
+    Estimate the number of results of a search query without running it:
+    from the query planner on PostgreSQL, and on SQLite from the number of
+    definitions of the words with the rarest trigram, which is two index
+    lookups for each of those words. Contains searches that would scan the
+    words, for want of a trigram index or of a key long enough for one, are
+    estimated from a sample of the words. Other searches are counted
+    exactly, which for exact, prefix and suffix searches is an index range
+    scan.
+    '''
+    key = fold(text)
+    if session.bind.dialect.name == 'postgresql':
+        statement = q.statement.compile(session.bind)
+        cursor = session.connection().connection.cursor()
+        cursor.execute('EXPLAIN (FORMAT JSON) %s' % statement, statement.params)
+        (plans,), = cursor.fetchall()
+        return int(plans[0]['Plan']['Plan Rows'])
+    elif match == 'contains' and TRIGRAM_MINIMUM <= len(key) and trigram:
+        trigrams = {key[i:i+TRIGRAM_MINIMUM]
+                    for i in range(len(key) - TRIGRAM_MINIMUM + 1)}
+        counts = session.query(TRIGRAM_VOCAB.c.term, TRIGRAM_VOCAB.c.doc) \
+            .filter(TRIGRAM_VOCAB.c.term.in_(trigrams)).all()
+        if len(counts) < len(trigrams):
+            return 0
+        rarest, _ = min(counts, key=lambda count: count[1])
+        words = _trigram_words(rarest)
+        return sum(session.query(func.count(Dictionary.id)) \
+                       .filter(column.in_(words)).scalar()
+                   for column in (Dictionary.from_word_id, Dictionary.to_word_id))
+    elif match == 'contains':
+        return _sample_estimate(session, key, from_langs, to_langs)
+    else:
+        return q.count()
+
+def _sample_estimate(session, key, from_langs, to_langs):
+    '''
+    Estimate the number of results of a contains search as the share of
+    the first SAMPLE words whose keys contain the key, times the number of
+    definitions of the language pairs from :py:class:`Statistic`
+    '''
+    w = WordModel.__table__
+    sample = select([w.c.key, w.c.roman_key]).order_by(w.c.id) \
+        .limit(SAMPLE).alias('sample')
+    size = session.query(func.count()).select_from(sample).scalar()
+    if not size:
+        return 0
+    matched = session.query(func.count()).select_from(sample).filter(or_(
+        sample.c.roman_key.contains(key, autoescape=True),
+        sample.c.key.contains(key, autoescape=True),
+    )).scalar()
+
+    FromLanguage = aliased(Language)
+    ToLanguage = aliased(Language)
+    q = session.query(func.sum(Statistic.count)) \
+        .join(FromLanguage, Statistic.from_lang_id == FromLanguage.id) \
+        .join(ToLanguage,   Statistic.to_lang_id   == ToLanguage.id)
+    if from_langs:
+        q = q.filter(FromLanguage.code.in_(from_langs))
+    if to_langs:
+        q = q.filter(ToLanguage.code.in_(to_langs))
+    return round((q.scalar() or 0) * matched / size)
+
+SURROGATES = (0xd800, 0xdfff)
+
+def _starts_with(column, prefix):
+    '''
+    Range condition for strings that start with prefix, which a B-tree index
+    on a code-point-ordered column can answer
+    '''
+    prefix = prefix.rstrip(chr(maxunicode))
+    if prefix:
+        following = ord(prefix[-1]) + 1
+        if SURROGATES[0] <= following <= SURROGATES[1]:
+            # Surrogates cannot be encoded, and no key contains them.
+            following = SURROGATES[1] + 1
+        upper = prefix[:-1] + chr(following)
+        return and_(column >= prefix, column < upper)
+    else:
+        return column.isnot(None)
+
+SearchResult = namedtuple('SearchResult', (
+    'part_of_speech','from_lang', 'from_word', 'to_lang', 'to_word',
+))
+
+class Vortaro(object):
+    '''
+    Dictionaries in one database. A Vortaro keeps one engine, with its pool
+    of connections, and caches what it knows about the database until the
+    definitions change; it can be shared between threads, as each call
+    uses its own session. The module-level functions use one Vortaro for
+    each database URL.
+
+    :param database: SQLAlchemy database URL
+    '''
+    def __init__(self, database=DATABASE):
+        self.database = database
+        self._sessionmakers = {}
+        self._lock = Lock()
+        self._language_pairs = None
+        self._has_trigram_index = None
+
+    @contextmanager
+    def session(self, profile=None, upgrade=False):
+        '''
+        :param profile: 'index' for loading definitions, 'serve' for
+            read-only searches, or None for anything else; see
+            :py:data:`vortaro.models.SQLITE_PROFILES`
+        :param upgrade: Rebuild the tables if the database is from an older
+            version, dropping its definitions, rather than raising
+            :py:class:`vortaro.models.SchemaError`; for indexing
+        '''
+        if not has_profiles(self.database):
+            profile = None
+        with self._lock:
+            if None not in self._sessionmakers:
+                # The default engine checks the schema, and creates the
+                # tables of a new database, before any profile opens it.
+                self._sessionmakers[None] = \
+                    sessionmaker(bind=Engine(self.database, upgrade=upgrade))
+            if profile not in self._sessionmakers:
+                self._sessionmakers[profile] = \
+                    sessionmaker(bind=Engine(self.database, profile))
+            Session = self._sessionmakers[profile]
+        session = Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    def download(self, source, noindex=False, chunksize=CHUNKSIZE, data_dir=DATA):
+        '''
+        Download a dictionary; see :py:func:`vortaro.download`.
+        '''
+        subdir = data_dir / source
+        makedirs(subdir, exist_ok=True)
+        FORMATS[source].download(subdir)
+        if not noindex:
+            with self.session('index', upgrade=True) as session:
+                _update(session, chunksize, 1, False,
+                    _stale_files(session, False, source, subdir))
+                _write_native(session, 'sql', data_dir)
+
+    def index(self, *sources, refresh=False, chunksize=CHUNKSIZE, jobs=1,
+              data_dir=DATA, engine='sql'):
+        '''
+        Index dictionaries; see :py:func:`vortaro.index`.
+        '''
+        if engine not in ENGINES:
+            raise ValueError('engine must be one of: %s' % ', '.join(ENGINES))
+        with self.session('index', upgrade=True) as session:
+            files = []
+            for name in sources or FORMATS:
+                directory = data_dir / name
+                if directory.is_dir() and any(f.is_file() for f in directory.iterdir()):
+                    files.extend(_stale_files(session, refresh, directory.name, directory))
+            _update(session, chunksize, jobs, refresh, files)
+            _write_native(session, engine, data_dir)
+
+    def languages(self, pairs=False):
+        '''
+        List from-languages; see :py:func:`vortaro.languages`.
+        '''
+        with self.session('serve') as session:
+            FromLanguage = aliased(Language)
+            ToLanguage = aliased(Language)
+            q = session.query(Statistic) \
+                .join(FromLanguage, Statistic.from_lang_id == FromLanguage.id) \
+                .join(ToLanguage,   Statistic.to_lang_id   == ToLanguage.id)
+            if pairs:
+                q = q.with_entities(FromLanguage.code, ToLanguage.code,
+                                    func.sum(Statistic.count)) \
+                    .group_by(FromLanguage.code, ToLanguage.code) \
+                    .order_by(FromLanguage.code, ToLanguage.code)
+                for from_lang, to_lang, count in q:
+                    yield '%s\t%s\t%d' % (from_lang, to_lang, count)
+            else:
+                q = q.with_entities(FromLanguage.code).distinct() \
+                    .order_by(FromLanguage.code)
+                for language, in q:
+                    yield language
+
+    def search(self, text, *, from_langs=(), to_langs=(), match='contains',
+               columns=SearchResult._fields, cache=None, engine='sql',
+               data_dir=DATA):
+        '''
+        Search for a word; see :py:func:`vortaro.search`.
+        '''
+        columns = tuple(columns)
+        unknown = set(columns) - set(SearchResult._fields)
+        if unknown:
+            raise ValueError('No such columns: %s' % ', '.join(sorted(unknown)))
+        Result = _result_type(columns)
+
+        if engine == 'native':
+            fields = tuple(native.FIELDS.index(column) for column in columns)
+            rows = sorted(self.native_search(data_dir, from_langs, to_langs,
+                                             text, match), key=_native_order)
+            for row in rows:
+                yield Result._make(row[i] for i in fields)
+            return
+        elif engine not in ENGINES:
+            raise ValueError('engine must be one of: %s' % ', '.join(ENGINES))
+
+        with self.session('serve') as session:
+            if cache is None:
+                rows = self._search_rows(session, from_langs, to_langs, text,
+                                         match, columns)
+            else:
+                key = _cache_key(session, 'search', text, from_langs, to_langs,
+                                 match, columns)
+                rows = cache.get(key)
+                if rows is None:
+                    rows = list(self._search_rows(session, from_langs, to_langs,
+                                                  text, match, columns))
+                    cache.set(key, rows)
+            for row in rows:
+                yield Result._make(row)
+
+    def _search_rows(self, session, from_langs, to_langs, text, match, columns):
+        q, Definition, FromLanguage, ToLanguage = \
+            self.search_query(session, from_langs, to_langs, text, match)
+        expressions = {
+            'part_of_speech': PartOfSpeech.text,
+            'from_lang': FromLanguage.code,
+            'from_word': Definition.c.from_original,
+            'to_lang': ToLanguage.code,
+            'to_word': Definition.c.to_word,
+        }
+        q = q.join(PartOfSpeech, Definition.c.part_of_speech_id == PartOfSpeech.id) \
+            .order_by(*_order_by(SEARCH_ORDER, Definition)) \
+            .with_entities(*(expressions[column].label(column) for column in columns))
+        for row in q:
+            yield tuple(row)
+
+    def search_query(self, session, from_langs, to_langs, text, match='contains'):
+        '''
+        Query for definitions that match a search, warning about languages
+        that are not in the database
+
+        :returns: The query, the selectable from
+            :py:func:`vortaro.models.oriented` that it reads from, with a row
+            for each direction of each translation, and the aliases of
+            :py:class:`Language` for the from- and to-languages
+        '''
+        if from_langs or to_langs:
+            pairs = self.language_pairs(session)
+            indexed_from = {from_lang for from_lang, _ in pairs}
+            indexed_to = {to_lang for _, to_lang in pairs}
+            missing = tuple(lang for lang in from_langs if lang not in indexed_from) + \
+                tuple(lang for lang in to_langs if lang not in indexed_to)
+            if missing:
+                logger.warn('No such languages: %s\n' % (', '.join(missing)))
+        return _search_query(session, from_langs, to_langs, text, match,
+                             self.has_trigram_index(session))
+
+    def native_search(self, data_dir, from_langs, to_langs, text, match='contains'):
+        '''
+        Find the definitions that match a search in the native search file,
+        warning about languages that are not in it, and if the file was not
+        written from the database as it is now, in which case the results
+        are those of the database when the file was written
+
+        :param pathlib.Path data_dir: Vortaro data directory, where
+            :py:meth:`index` writes the file
+        :returns: Rows of :py:data:`vortaro.native.FIELDS`, in no
+            particular order
+        '''
+        if match not in MATCHES:
+            raise ValueError('match must be one of: %s' % ', '.join(MATCHES))
+        path = data_dir / native.FILENAME
+        index = native.load(path)
+        with self.session('serve') as session:
+            if index.generation != generation(session):
+                logger.warning('%s is out of date with the database; index '
+                               'with the native engine to write it again' % path)
+        if from_langs or to_langs:
+            indexed = index.languages()
+            missing = tuple(lang for lang in tuple(from_langs) + tuple(to_langs)
+                            if lang not in indexed)
+            if missing:
+                logger.warn('No such languages: %s\n' % (', '.join(missing)))
+        return index.search(text, from_langs, to_langs, match)
+
+    def language_pairs(self, session):
+        '''
+        Set of (from-language, to-language) codes that have definitions
+        '''
+        current = generation(session)
+        with self._lock:
+            if self._language_pairs is None or self._language_pairs[0] != current:
+                self._language_pairs = (current, frozenset(_language_pairs(session)))
+            return self._language_pairs[1]
+
+    def has_trigram_index(self, session):
+        with self._lock:
+            if self._has_trigram_index is None:
+                self._has_trigram_index = has_trigram_index(session)
+            return self._has_trigram_index
+
+_clients = {}
+_clients_lock = Lock()
+def _client(database):
+    with _clients_lock:
+        if database not in _clients:
+            _clients[database] = Vortaro(database)
+        return _clients[database]
+
 def download(source: tuple(FORMATS), noindex=False, chunksize: int=CHUNKSIZE,
         data_dir: Path=DATA, database=DATABASE):
     '''
@@ -52,17 +516,13 @@ def download(source: tuple(FORMATS), noindex=False, chunksize: int=CHUNKSIZE,
     :param pathlib.path data_dir: Vortaro data directory
     :param bool noindex: Do not update the index
     :param database: SQLAlchemy database URL
-    :param chunksize: Chunk size for commits; lower this if you get a MemoryError
+    :param chunksize: Number of definitions to insert and commit at a time
     '''
-    session = SessionMaker(database)
-    subdir = data_dir / source
-    makedirs(subdir, exist_ok=True)
-    FORMATS[source].download(subdir)
-    if not noindex:
-        _index_subdir(session, chunksize, False, source, subdir)
+    _client(database).download(source, noindex, chunksize, data_dir)
 
 def index(*sources: tuple(FORMATS), refresh=False, chunksize: int=CHUNKSIZE,
-        data_dir: Path=DATA, database=DATABASE):
+        jobs: int=1, data_dir: Path=DATA, database=DATABASE,
+        engine: ENGINES='sql'):
     '''
     Index dictionaries.
 
@@ -70,93 +530,64 @@ def index(*sources: tuple(FORMATS), refresh=False, chunksize: int=CHUNKSIZE,
     :param pathlib.path data_dir: Vortaro data directory
     :param bool refresh: Replace the existing index.
     :param database: SQLAlchemy database URL
-    :param chunksize: Chunk size for commits; lower this if you get a MemoryError
+    :param chunksize: Number of definitions to insert and commit at a time
+    :param jobs: Number of processes for reading dictionary files
+    :param engine: 'native' to also write the native search file to the
+        data directory; once it is there, indexing keeps it up to date.
     '''
-    session = SessionMaker(database)
-    for name in sources or FORMATS:
-        directory = data_dir / name
-        if directory.is_dir() and any(f.is_file() for f in directory.iterdir()):
-            _index_subdir(session, chunksize, refresh, directory.name, directory)
-
-def _index_subdir(session, chunksize, refresh, format_name, directory):
-    for path in directory.iterdir():
-        if path.is_file():
-            format = get_or_create(session, Format, name=format_name)
-            file = get_or_create(session, File, path=str(path), format=format)
-            if refresh or file.out_of_date:
-                file.update(FORMATS[file.format.name].read, session, chunksize)
-                logger.info('Indexed %s\n' % path)
+    _client(database).index(*sources, refresh=refresh, chunksize=chunksize,
+                            jobs=jobs, data_dir=data_dir, engine=engine)
 
-def languages(database=DATABASE):
+def languages(database=DATABASE, *, pairs=False):
     '''
     List from-languages that have been indexed.
 
+    :param pairs: List pairs of from- and to-languages instead, with the
+        number of definitions for each pair
     :param database: SQLAlchemy database URL
     '''
-    session = SessionMaker(database)
-    q = session.query(Language.code).order_by(Language.code)
-    for language, in q.all():
-        yield language
-
-def _search_query(session, from_langs, to_langs, text):
-    # Check whether languages are in the database.
-    if from_langs or to_langs:
-        langs = tuple(from_langs) + tuple(to_langs)
-        q = session.query(Language).filter(Language.code.in_(langs))
-        if q.count() < len(langs):
-            def f(lang):
-                return session.query(~exists().where(Language.code==lang)).scalar()
-            missing = tuple(filter(f, langs))
-            if missing:
-                logger.warn('No such languages: %s\n' % (', '.join(missing)))
-
-    # Main search query
-    ToLanguage = aliased(Language)
-    FromLanguage = aliased(Language)
-    q = session.query(Dictionary) \
-        .join(FromLanguage, Dictionary.from_lang_id == FromLanguage.id) \
-        .join(ToLanguage,   Dictionary.to_lang_id   == ToLanguage.id)
-    if from_langs:
-        q = q.filter(FromLanguage.code.in_(from_langs))
-    if to_langs:
-        q = q.filter(ToLanguage.code.in_(to_langs))
-    ltext = text.lower()
-    q = q.filter(or_(
-        func.lower(Dictionary.from_roman_transliteration).contains(ltext),
-        func.lower(Dictionary.from_original).contains(ltext),
-    ))
-    return q, FromLanguage, ToLanguage
-
-SearchResult = namedtuple('SearchResult', (
-    'part_of_speech','from_lang', 'from_word', 'to_lang', 'to_word',
-))
+    return _client(database).languages(pairs)
 
 def search(text: Word, *, database=DATABASE,
-        from_langs: [str]=(), to_langs: [str]=()):
+        from_langs: [str]=(), to_langs: [str]=(), match: MATCHES='contains',
+        columns=SearchResult._fields, cache=None, engine: ENGINES='sql',
+        data_dir: Path=DATA):
     '''
     Search for a word in the dictionaries.
 
     :param text: The word/fragment you are searching for
     :param from_langs: Languages the word is in, defaults to all
     :param to_langs: Languages to look for translations, defaults to all
+    :param match: Whether words should contain the text, equal it,
+        start with it (prefix), or end with it (suffix)
+    :param columns: Fields of :py:class:`SearchResult` to select; results
+        are named tuples of only these fields.
+    :param cache: :py:class:`vortaro.cache.Cache` to keep the results in,
+        whole, or None (the default) to read them from the database as
+        they are found
+    :param engine: 'sql' to search the database, or 'native' to search the
+        native search file that ``index -engine native`` writes instead;
+        native results are not cached
+    :param pathlib.path data_dir: Vortaro data directory, for the native
+        search file
     :param database: SQLAlchemy database URL
     '''
-    session = SessionMaker(database)
-    q, *_ = _search_query(session, from_langs, to_langs, text)
-    q = q.join(PartOfSpeech, Dictionary.part_of_speech_id == PartOfSpeech.id) \
-        .order_by(
-            Dictionary.from_length,
-            PartOfSpeech.text,
-            Dictionary.from_word,
-            Dictionary.to_word,
-        #   FromLanguage.code,
-        #   ToLanguage.code,
-        )
-    for definition in q:
-        yield SearchResult(
-            part_of_speech=definition.part_of_speech.text,
-            from_lang=definition.from_lang.code,
-            from_word=definition.from_original,
-            to_lang=definition.to_lang.code,
-            to_word=definition.to_word,
-        )
+    return _client(database).search(text, from_langs=from_langs,
+        to_langs=to_langs, match=match, columns=columns, cache=cache,
+        engine=engine, data_dir=data_dir)
+
+@lru_cache(None)
+def _result_type(columns):
+    if columns == SearchResult._fields:
+        return SearchResult
+    else:
+        return namedtuple('SearchResult', columns)
+
+def _cache_key(session, kind, text, from_langs, to_langs, match, *args):
+    '''
+    Key for cached results of a search, which changes when the definitions
+    change
+    '''
+    return (kind, repr(session.bind.url), fold(text),
+            tuple(sorted(set(from_langs))), tuple(sorted(set(to_langs))),
+            match) + args + (generation(session),)
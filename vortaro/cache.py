@@ -0,0 +1,160 @@
+# vortaro
+# Copyright (C) 2017, 2018 Thomas Levine
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+Cache search results. Keys include the index generation
+(:py:func:`vortaro.models.generation`), which changes whenever indexing
+changes the definitions, so stale results are never found.
+'''
+
+import pickle
+import sqlite3
+from collections import OrderedDict, namedtuple
+from logging import getLogger
+from threading import Lock
+
+logger = getLogger(__name__)
+
+MAXSIZE = 1024
+
+CacheInfo = namedtuple('CacheInfo', ('hits', 'misses', 'maxsize', 'currsize'))
+
+class Cache(object):
+    '''
+    Map keys (tuples of strings and numbers) to results, evicting the least
+    recently used entries beyond maxsize. With a path, entries and counters
+    are kept in an SQLite file there, so that they last between runs of the
+    command line program; otherwise they are kept in memory.
+    '''
+    def __init__(self, maxsize=MAXSIZE, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self._hits = 0
+        self._misses = 0
+        self._entries = OrderedDict()
+        self._connection = None
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if self.path:
+                value = self._disk(self._disk_get, repr(key))
+            elif key in self._entries:
+                self._entries.move_to_end(key)
+                value = self._entries[key]
+            else:
+                value = None
+            if value is None:
+                self._count('misses')
+                return default
+            else:
+                self._count('hits')
+                return value
+
+    def set(self, key, value):
+        with self._lock:
+            if self.path:
+                self._disk(self._disk_set, repr(key), value)
+            else:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            if self.path:
+                self._disk(self._disk_clear)
+            else:
+                self._entries.clear()
+                self._hits = self._misses = 0
+
+    def info(self):
+        with self._lock:
+            if self.path:
+                return self._disk(self._disk_info) or \
+                    CacheInfo(0, 0, self.maxsize, 0)
+            else:
+                return CacheInfo(self._hits, self._misses,
+                                 self.maxsize, len(self._entries))
+
+    def _count(self, name):
+        if self.path:
+            self._disk(self._disk_count, name)
+        else:
+            setattr(self, '_' + name, getattr(self, '_' + name) + 1)
+
+    def _disk(self, method, *args):
+        # The cache must never break a search, so a broken file is a miss.
+        try:
+            if self._connection is None:
+                self._connection = _connect(self.path)
+            return method(self._connection, *args)
+        except sqlite3.Error as e:
+            logger.warning('Could not use the cache at %s: %s' % (self.path, e))
+
+    def _disk_get(self, connection, key):
+        row = connection.execute(
+            'SELECT value FROM entry WHERE key = ?', (key,)).fetchone()
+        if row:
+            connection.execute(
+                'UPDATE entry SET used = (SELECT max(used) + 1 FROM entry) '
+                'WHERE key = ?', (key,))
+            return pickle.loads(row[0])
+
+    def _disk_set(self, connection, key, value):
+        with connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO entry (key, value, used) VALUES '
+                '(?, ?, (SELECT coalesce(max(used), 0) + 1 FROM entry))',
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+            connection.execute(
+                'DELETE FROM entry WHERE used <= (SELECT used FROM entry '
+                'ORDER BY used DESC LIMIT 1 OFFSET ?)', (self.maxsize,))
+
+    def _disk_clear(self, connection):
+        with connection:
+            connection.execute('DELETE FROM entry')
+            connection.execute('UPDATE counter SET value = 0')
+
+    def _disk_count(self, connection, name):
+        connection.execute(
+            'UPDATE counter SET value = value + 1 WHERE name = ?', (name,))
+
+    def _disk_info(self, connection):
+        counters = dict(connection.execute('SELECT name, value FROM counter'))
+        currsize, = connection.execute('SELECT count(*) FROM entry').fetchone()
+        return CacheInfo(counters['hits'], counters['misses'],
+                         self.maxsize, currsize)
+
+def _connect(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(str(path), timeout=10, isolation_level=None)
+    with connection:
+        connection.execute('''CREATE TABLE IF NOT EXISTS entry (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            used INTEGER NOT NULL
+        )''')
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS entry_used ON entry (used)')
+        connection.execute('''CREATE TABLE IF NOT EXISTS counter (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )''')
+        connection.execute("INSERT OR IGNORE INTO counter VALUES ('hits', 0)")
+        connection.execute("INSERT OR IGNORE INTO counter VALUES ('misses', 0)")
+    return connection
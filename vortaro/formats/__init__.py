@@ -14,13 +14,44 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+from collections.abc import Mapping
+from importlib import import_module
 
-from . import cedict, dictcc, espdic, wiktionary
+# Suffix of files that are being downloaded
+PART = '.part'
 
-FORMATS = OrderedDict((
-    ('dict.cc', dictcc),
-    ('cc-cedict', cedict),
-    ('espdic', espdic),
-    ('wiktionary', wiktionary),
+Pair = namedtuple('Pair', (
+    'part_of_speech',
+    'from_lang', 'from_word', 'from_text',
+    'to_lang', 'to_word', 'to_text',
+))
+Pair.__doc__ = '''
+A translation, which can be looked up from either word. The text of each
+word is how it is shown as a translation, if that is not the word itself,
+or else None. The read function of each format yields plain tuples with
+these fields in this order, which are smaller and quicker to make than
+dicts (or than Pairs), and the indexer unpacks them by position.
+'''
+
+class _Formats(Mapping):
+    '''
+    Format modules by name. Only the names are known up front; a module is
+    imported when it is first looked up, so that commands that do not read
+    or download dictionaries need not import parsers and HTTP libraries.
+    '''
+    def __init__(self, modules):
+        self._modules = OrderedDict(modules)
+    def __getitem__(self, name):
+        return import_module('.' + self._modules[name], __name__)
+    def __iter__(self):
+        return iter(self._modules)
+    def __len__(self):
+        return len(self._modules)
+
+FORMATS = _Formats((
+    ('dict.cc', 'dictcc'),
+    ('cc-cedict', 'cedict'),
+    ('espdic', 'espdic'),
+    ('wiktionary', 'wiktionary'),
 ))
@@ -16,9 +16,9 @@
 
 from functools import lru_cache
 from pathlib import Path
-from gzip import decompress
 from sys import stderr
 
+from .files import open_lines
 from .http import simple_download
 
 __all__ = ['download', 'read']
@@ -35,24 +35,23 @@ under the same license (share alike).''',
     'https://www.mdbg.net/chinese/dictionary?page=cc-cedict',
 )
 URL = 'https://www.mdbg.net/chinese/export/cedict/cedict_1_0_ts_utf-8_mdbg.txt.gz'
-FILENAME = Path(URL).with_suffix('.txt').name
+FILENAME = Path(URL).name
 
 def download(directory):
     file = (directory / FILENAME)
-    if file.exists():
+    if file.exists() or file.with_suffix('').exists():
         stderr.write('CC-CEDICT is already downloaded.\n')
     else:
-        body = decompress(simple_download(URL, LICENSE, directory))
-        with file.open('wb') as fp:
-            fp.write(body)
+        simple_download(URL, LICENSE, file)
 
 def read(path):
     '''
     Read a dictionary file
 
-    :param pathlib.Path: Dictionary file
+    :param pathlib.Path: Dictionary file, perhaps compressed
+    :returns: Tuples of the fields of :py:class:`vortaro.formats.Pair`
     '''
-    with path.open() as fp:
+    with open_lines(path) as fp:
         in_header = True
         for rawline in fp:
             if in_header:
@@ -61,37 +60,16 @@ def read(path):
                 else:
                     in_header = False
 
-            traditional, simplified, _rest = rawline[:-1].split(' ', 2)
+            traditional, simplified, _rest = rawline.split(' ', 2)
             _pinyin, *englishes, _ = _rest.split('/')
             pinyin = _pinyin[1:-2]
             ppinyin = _render_pinyin(pinyin)
 
+            zh = '%s [%s]' % (traditional, ppinyin)
+            zh_cn = '%s [%s]' % (simplified, ppinyin)
             for english in englishes:
-                base = {
-                    'from_lang': 'en',
-                    'from_word': english,
-                }
-                yield dict(**base, **{
-                    'to_lang': 'zh',
-                    'to_word': '%s [%s]' % (traditional, ppinyin),
-                })
-                yield dict(**base, **{
-                    'to_lang': 'zh_CN',
-                    'to_word': '%s [%s]' % (simplified, ppinyin),
-                })
-
-                base = {
-                    'to_lang': 'en',
-                    'to_word': english,
-                }
-                yield dict(**base, **{
-                    'from_lang': 'zh',
-                    'from_word': '%s [%s]' % (traditional, ppinyin),
-                })
-                yield dict(**base, **{
-                    'from_lang': 'zh_CN',
-                    'from_word': '%s [%s]' % (simplified, ppinyin),
-                })
+                yield ('', 'en', english, None, 'zh', zh, None)
+                yield ('', 'en', english, None, 'zh_CN', zh_cn, None)
 
 TONES = {
     'a': 'āáǎàa',
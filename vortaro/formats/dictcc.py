@@ -21,16 +21,18 @@ from textwrap import wrap
 from functools import lru_cache
 from shutil import get_terminal_size
 
+from .files import open_lines
+
 __all__ = ['download', 'read']
 
 COLUMNS, ROWS = get_terminal_size((80, 20))
-PAIR = re.compile(rb'# ([A-Z]+)-([A-Z]+) vocabulary database	compiled by dict\.cc$')
+PAIR = re.compile(r'# ([A-Z]+)-([A-Z]+) vocabulary database	compiled by dict\.cc$')
 
 def download(data_dir):
     directions = '''\
 The download page will open in a web browser. Download the dictionary
-of interest (as zipped text), unzip it, and put the text file inside this
-directory: %s/''' % data_dir
+of interest (as zipped text), and put the zip file inside this directory:
+%s/''' % data_dir
     for line in wrap(directions, COLUMNS):
         stdout.write(line + '\n')
     stdout.write('\n')
@@ -39,16 +41,19 @@ directory: %s/''' % data_dir
     webbrowser.open('https://www1.dict.cc/translation_file_request.php?l=e')
 
 def read(path):
-    with path.open('rb') as fp:
-        firstline = fp.readline()[:-1]
+    '''
+    Read a dictionary file
 
-    m = PAIR.match(firstline)
-    if m:
-        left_lang, right_lang = (g.decode('utf-8').lower() for g in m.groups())
-    else:
-        raise StopIteration
+    :param pathlib.Path path: Dictionary file, perhaps compressed
+    :returns: Tuples of the fields of :py:class:`vortaro.formats.Pair`
+    '''
+    with open_lines(path) as fp:
+        m = PAIR.match(next(fp, ''))
+        if m:
+            left_lang, right_lang = (g.lower() for g in m.groups())
+        else:
+            return
 
-    with path.open() as fp:
         in_header = True
         for rawline in fp:
             if in_header:
@@ -56,27 +61,15 @@ def read(path):
                     continue
                 else:
                     in_header = False
-            cells = rawline[:-1].split('\t')
+            cells = rawline.split('\t')
             try:
                 left_word, right_word, pos, *_ = cells
             except Exception as e:
                 stderr.write('Could not parse: %s\n' % repr(rawline))
                 stderr.write('%s: %s\n' % (e, repr(cells)))
             else:
-                yield {
-                    'part_of_speech': pos,
-                    'from_lang': left_lang,
-                    'from_word': _truncate(left_word),
-                    'to_lang': right_lang,
-                    'to_word': right_word,
-                }
-                yield {
-                    'part_of_speech': pos,
-                    'from_lang': right_lang,
-                    'from_word': _truncate(right_word),
-                    'to_lang': left_lang,
-                    'to_word': left_word,
-                }
+                yield (pos, left_lang, _truncate(left_word), left_word,
+                       right_lang, _truncate(right_word), right_word)
 
 _sep = re.compile(r' [\[{]')
 @lru_cache(1)
@@ -17,6 +17,7 @@
 from sys import stderr
 from functools import lru_cache
 
+from .files import open_lines
 from .http import simple_download
 
 __all__ = ['download', 'read']
@@ -35,35 +36,22 @@ def download(directory):
     if file.exists():
         stderr.write('ESPDIC is already downloaded.\n')
     else:
-        body = simple_download(URL, LICENSE, directory)
-        with file.open('wb') as fp:
-            fp.write(body)
+        simple_download(URL, LICENSE, file)
 
 def read(path):
     '''
     Read a dictionary file
 
-    :param pathlib.Path path: Dictionary file
+    :param pathlib.Path path: Dictionary file, perhaps compressed
+    :returns: Tuples of the fields of :py:class:`vortaro.formats.Pair`
     '''
-    with path.open() as fp:
-        next(fp)
+    with open_lines(path) as fp:
+        next(fp, None)
         for rawline in fp:
-            l, rs = rawline[:-1].split(' : ')
+            l, rs = rawline.split(' : ')
+            pos = _part_of_speech(l[-2:])
             for r in rs.split(', '):
-                yield {
-                    'part_of_speech': _part_of_speech(l[-2:]),
-                    'from_lang': 'eo',
-                    'from_word': l,
-                    'to_lang': 'en',
-                    'to_word': r,
-                }
-                yield {
-                    'part_of_speech': _part_of_speech(l[-2:]),
-                    'from_lang': 'en',
-                    'from_word': r,
-                    'to_lang': 'eo',
-                    'to_word': l,
-                }
+                yield (pos, 'eo', l, None, 'en', r, None)
 
 POS = (
     ('noun', ('o', 'oj')),
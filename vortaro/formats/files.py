@@ -0,0 +1,96 @@
+# vortaro
+# Copyright (C) 2017, 2018 Thomas Levine
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+Open dictionary files, which may be compressed
+'''
+
+import bz2
+import gzip
+import lzma
+import mmap
+from contextlib import contextmanager
+from functools import partial
+from io import BytesIO
+from zipfile import ZipFile
+
+BLOCK = 2 ** 20
+COMPRESSED = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+}
+
+@contextmanager
+def open_binary(path):
+    '''
+    Open a dictionary file for reading bytes. Files whose names end with
+    .gz, .bz2 or .xz are decompressed as they are read, as is the first file
+    in a .zip file, and other files are memory-mapped.
+
+    :param pathlib.Path path: Dictionary file
+    '''
+    suffix = path.suffix.lower()
+    if suffix in COMPRESSED:
+        with COMPRESSED[suffix](str(path), 'rb') as fp:
+            yield fp
+    elif suffix == '.zip':
+        with ZipFile(str(path)) as zp:
+            members = [info for info in zp.infolist() if not info.is_dir()]
+            if not members:
+                raise ValueError('%s is empty' % path)
+            with zp.open(members[0]) as fp:
+                yield fp
+    else:
+        with path.open('rb') as fp:
+            if path.stat().st_size:
+                with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    yield mm
+            else:
+                yield BytesIO()
+
+@contextmanager
+def open_lines(path, encoding='utf-8'):
+    '''
+    Open a dictionary file (see :py:func:`open_binary`) for reading lines,
+    without their endings. As in text mode, lines may end with \\n, \\r\\n
+    or \\r.
+
+    :param pathlib.Path path: Dictionary file
+    :param str encoding: Character encoding
+    '''
+    with open_binary(path) as fp:
+        yield _lines(fp, encoding)
+
+def _lines(fp, encoding):
+    rest = b''
+    for block in iter(partial(fp.read, BLOCK), b''):
+        block = rest + block
+        # A final \r might be followed by \n in the next block.
+        end = max(block.rfind(b'\n'), block.rfind(b'\r', 0, -1)) + 1
+        rest = block[end:]
+        if end:
+            yield from _split(block[:end].decode(encoding))
+    if rest:
+        yield from _split(rest.decode(encoding) + '\n')
+
+def _split(text):
+    '''
+    :param str text: Whole lines
+    '''
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text.split('\n')[:-1]
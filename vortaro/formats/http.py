@@ -14,40 +14,144 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import pickle
+import hashlib
+import json
+import re
+from collections import namedtuple
 from os import makedirs
 from textwrap import wrap
 from functools import partial
 from sys import stdout, stderr, exit
 from shutil import get_terminal_size
 
-from requests import get as _get
+from requests import get as _get, RequestException
+
+from . import PART
 
 COLUMNS, ROWS = get_terminal_size((80, 20))
+HEADERS = {'user-agent': 'https://pypi.python.org/pypi/vortaro'}
+CHUNK = 2 ** 16
+CONTENT_RANGE = re.compile(r'bytes (?:(\d+)-\d+|\*)/(\d+|\*)')
+
+Page = namedtuple('Page', ('url', 'content'))
+
+def get(url, cache=None):
+    '''
+    Get a page. With a cache directory, the body is kept there with its
+    ETag and Last-Modified validators, and it is downloaded again only if
+    the server says that it has changed.
+
+    :param str url: URL of the page
+    :param pathlib.Path cache: Cache directory
+    :rtype: Page
+    '''
+    headers = dict(HEADERS)
+    if cache:
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        body = cache / key
+        meta = cache / (key + '.json')
+        if body.exists() and meta.exists():
+            with meta.open() as fp:
+                validators = json.load(fp)
+            if validators.get('etag'):
+                headers['if-none-match'] = validators['etag']
+            if validators.get('last-modified'):
+                headers['if-modified-since'] = validators['last-modified']
+    r = _get(url, headers=headers)
+    if cache and r.status_code == 304:
+        return Page(validators['url'], body.read_bytes())
+    r.raise_for_status()
+    if cache:
+        makedirs(cache, exist_ok=True)
+        _write(body, r.content)
+        _write(meta, json.dumps({
+            'url': r.url,
+            'etag': r.headers.get('etag'),
+            'last-modified': r.headers.get('last-modified'),
+        }).encode('utf-8'))
+    return Page(r.url, r.content)
+
+def _write(path, content):
+    part = path.with_name(path.name + PART)
+    part.write_bytes(content)
+    part.replace(path)
 
-def get(url, path=None):
-    f = partial(_get, url, headers={'user-agent': 'https://pypi.python.org/pypi/vortaro'})
-    if path == None:
-        r = f()
-    else:
-        makedirs(path.parent, exist_ok=True)
-        if path.exists():
-            with path.open('rb') as fp:
-                r = pickle.load(fp)
+def download(url, path, checksum=None):
+    '''
+    Download a file in chunks, so that it need not fit in memory. The file
+    is written to a partial file beside it and renamed when it is complete;
+    if the partial file is already there, only the rest is requested, and
+    the whole file is downloaded again if the server's answer does not
+    continue it.
+
+    :param str url: URL of the file
+    :param pathlib.Path path: Where to put it
+    :param tuple checksum: Name of a :py:mod:`hashlib` algorithm and the
+        expected hexadecimal digest
+    :raises ValueError: If the file does not match the checksum
+    '''
+    makedirs(path.parent, exist_ok=True)
+    part = path.with_name(path.name + PART)
+    offset = part.stat().st_size if part.exists() else 0
+    if not (offset and _resume(url, part, offset)):
+        with _get(url, headers=HEADERS, stream=True) as r:
+            r.raise_for_status()
+            _save(r, part, 'wb')
+    if checksum:
+        algorithm, expected = checksum
+        observed = _digest(part, algorithm)
+        if observed != expected.lower():
+            part.unlink()
+            raise ValueError('%s of %s is %s, not %s' % (
+                algorithm, url, observed, expected))
+    part.replace(path)
+
+def _resume(url, part, offset):
+    '''
+    Request the rest of a partial file. The response is used only if its
+    Content-Range shows that it continues the partial file or, for a 416,
+    that the partial file is already the whole file.
+
+    :param int offset: Size of the partial file
+    :returns: Whether the file is complete; if not, it must be downloaded
+        again from the start
+    '''
+    headers = dict(HEADERS, range='bytes=%d-' % offset)
+    with _get(url, headers=headers, stream=True) as r:
+        m = CONTENT_RANGE.match(r.headers.get('content-range', ''))
+        if r.status_code == 416:
+            return bool(m) and m.group(2) == str(offset)
+        r.raise_for_status()
+        if r.status_code != 206:
+            _save(r, part, 'wb')
+        elif m and m.group(1) == str(offset):
+            _save(r, part, 'ab')
         else:
-            r = f()
-            with path.open('wb') as fp:
-                pickle.dump(r, fp)
-    return r
+            return False
+    return True
+
+def _save(r, part, mode):
+    with part.open(mode) as fp:
+        for chunk in r.iter_content(CHUNK):
+            fp.write(chunk)
+
+def _digest(path, algorithm):
+    h = hashlib.new(algorithm)
+    with path.open('rb') as fp:
+        for chunk in iter(partial(fp.read, CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
 
-def simple_download(url, license, directory):
+def simple_download(url, license, path):
+    '''
+    Show a license, and download a file.
+    '''
     for paragraph in license:
         for line in wrap(paragraph, COLUMNS):
             stdout.write(line + '\n')
         stdout.write('\n')
-    r = get(url)
-    if r.ok:
-        return r.content
-    else:
-        stderr.write('Problem downloading %s\n' % url)
+    try:
+        download(url, path)
+    except RequestException as e:
+        stderr.write('Problem downloading %s: %s\n' % (url, e))
         exit(1)
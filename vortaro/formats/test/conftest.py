@@ -0,0 +1,75 @@
+import hashlib
+import re
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+
+import pytest
+
+from ..http import CHUNK
+
+LAST_MODIFIED = 'Mon, 01 Jan 2018 00:00:00 GMT'
+
+class Handler(BaseHTTPRequestHandler):
+    '''
+    Serve files from memory, with range requests and validators
+    '''
+    files = {}
+    ranges = True
+    skew = 0
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(dict(self.headers, path=self.path))
+        if self.path not in self.files:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = memoryview(self.files[self.path])
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if 'if-none-match' in self.headers:
+            unchanged = self.headers['if-none-match'] == etag
+        else:
+            unchanged = self.headers.get('if-modified-since') == LAST_MODIFIED
+        if unchanged:
+            self.send_response(304)
+            self.end_headers()
+            return
+        m = re.match(r'bytes=(\d+)-$', self.headers.get('range', ''))
+        if m and self.ranges:
+            offset = int(m.group(1)) + self.skew
+            if offset >= len(body):
+                self.send_response(416)
+                self.send_header('content-range', 'bytes */%d' % len(body))
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('content-range', 'bytes %d-%d/%d' % (
+                offset, len(body) - 1, len(body)))
+            body = body[offset:]
+        else:
+            self.send_response(200)
+        self.send_header('etag', etag)
+        self.send_header('last-modified', LAST_MODIFIED)
+        self.send_header('content-length', str(len(body)))
+        self.end_headers()
+        for i in range(0, len(body), CHUNK):
+            self.wfile.write(body[i:i+CHUNK])
+
+    def send_response(self, code, message=None):
+        self.requests[-1]['status'] = code
+        super().send_response(code, message)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(Handler, 'files', {})
+    monkeypatch.setattr(Handler, 'requests', [])
+    httpd = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = Thread(target=httpd.serve_forever, args=(0.05,))
+    thread.start()
+    yield 'http://127.0.0.1:%d' % httpd.server_port
+    httpd.shutdown()
+    thread.join()
+    httpd.server_close()
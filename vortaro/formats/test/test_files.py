@@ -0,0 +1,53 @@
+import bz2
+import gzip
+import lzma
+from zipfile import ZipFile
+
+import pytest
+
+from .. import files, dictcc, espdic
+from ..files import open_lines
+from ...test.conftest import DICTCC, ESPDIC
+
+def _write(path, body):
+    if path.suffix == '.zip':
+        with ZipFile(str(path), 'w') as zp:
+            zp.writestr('dictionary.txt', body)
+    else:
+        compress = {
+            '.gz': gzip.compress,
+            '.bz2': bz2.compress,
+            '.xz': lzma.compress,
+        }.get(path.suffix, bytes)
+        path.write_bytes(compress(body))
+    return path
+
+SUFFIXES = ('.txt', '.gz', '.bz2', '.xz', '.zip')
+
+@pytest.mark.parametrize('suffix', SUFFIXES)
+@pytest.mark.parametrize('block', (files.BLOCK, 1, 2, 3))
+@pytest.mark.parametrize('body, expected', (
+    (b'', []),
+    (b'a\nb\n', ['a', 'b']),
+    (b'a\r\nb\r\n\r\nc', ['a', 'b', '', 'c']),
+    (b'a\rb\r', ['a', 'b']),
+    ('ĉu\nслон\n'.encode('utf-8'), ['ĉu', 'слон']),
+))
+def test_open_lines(monkeypatch, tmp_path, suffix, block, body, expected):
+    monkeypatch.setattr(files, 'BLOCK', block)
+    path = _write(tmp_path / ('dictionary' + suffix), body)
+    with open_lines(path) as fp:
+        assert list(fp) == expected
+
+@pytest.mark.parametrize('suffix', SUFFIXES[1:])
+@pytest.mark.parametrize('module, body', ((dictcc, DICTCC), (espdic, ESPDIC)))
+def test_read(tmp_path, suffix, module, body):
+    plain = _write(tmp_path / 'dictionary.txt', body.encode('utf-8'))
+    compressed = _write(tmp_path / ('dictionary' + suffix), body.encode('utf-8'))
+    expected = list(module.read(plain))
+    assert expected
+    assert list(module.read(compressed)) == expected
+
+def test_dictcc_header(tmp_path):
+    path = _write(tmp_path / 'dictionary.txt', b'elephant\t\xd1\x81\xd0\xbb\xd0\xbe\xd0\xbd\n')
+    assert list(dictcc.read(path)) == []
@@ -0,0 +1,75 @@
+import gzip
+import hashlib
+import tracemalloc
+
+import pytest
+
+from .. import Pair, cedict
+from ..http import download, get
+from .conftest import Handler
+
+BODY = bytes(range(256)) * 4000
+
+@pytest.fixture(autouse=True)
+def body(monkeypatch, server):
+    monkeypatch.setitem(Handler.files, '/body', BODY)
+
+def test_download(server, tmp_path):
+    path = tmp_path / 'subdir' / 'body'
+    download(server + '/body', path, ('sha1', hashlib.sha1(BODY).hexdigest()))
+    assert path.read_bytes() == BODY
+    assert list(tmp_path.glob('**/*.part')) == []
+    assert 'range' not in Handler.requests[0]
+
+@pytest.mark.parametrize('ranges', (True, False))
+@pytest.mark.parametrize('done', (1000, len(BODY)))
+def test_resume(monkeypatch, server, tmp_path, ranges, done):
+    monkeypatch.setattr(Handler, 'ranges', ranges)
+    path = tmp_path / 'body'
+    (tmp_path / 'body.part').write_bytes(BODY[:done])
+    download(server + '/body', path)
+    assert path.read_bytes() == BODY
+    assert Handler.requests[0]['range'] == 'bytes=%d-' % done
+
+@pytest.mark.parametrize('skew, done', ((-100, 1000), (0, len(BODY) + 10)))
+def test_resume_mismatch(monkeypatch, server, tmp_path, skew, done):
+    monkeypatch.setattr(Handler, 'skew', skew)
+    path = tmp_path / 'body'
+    (tmp_path / 'body.part').write_bytes(b'x' * done)
+    download(server + '/body', path)
+    assert path.read_bytes() == BODY
+    assert [request.get('range') for request in Handler.requests] == \
+        ['bytes=%d-' % done, None]
+
+def test_checksum(server, tmp_path):
+    path = tmp_path / 'body'
+    with pytest.raises(ValueError):
+        download(server + '/body', path, ('sha1', hashlib.sha1(b'').hexdigest()))
+    assert list(tmp_path.iterdir()) == []
+
+def test_memory(monkeypatch, server, tmp_path):
+    monkeypatch.setitem(Handler.files, '/big', BODY * 20)
+    tracemalloc.start()
+    try:
+        download(server + '/big', tmp_path / 'big')
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert (tmp_path / 'big').stat().st_size == len(BODY) * 20
+    assert peak < 4 * 2 ** 20
+
+def test_cedict(monkeypatch, server, tmp_path):
+    text = '# CC-CEDICT\n一 一 [yi1] /one/\n'.encode('utf-8')
+    monkeypatch.setitem(Handler.files, '/cedict.txt.gz', gzip.compress(text))
+    monkeypatch.setattr(cedict, 'URL', server + '/cedict.txt.gz')
+    cedict.download(tmp_path)
+    assert [path.name for path in tmp_path.iterdir()] == [cedict.FILENAME]
+    assert Pair(*next(cedict.read(tmp_path / cedict.FILENAME))).from_word == 'one'
+
+def test_get(server, tmp_path):
+    for _ in range(2):
+        page = get(server + '/body', tmp_path)
+        assert page == (server + '/body', BODY)
+    assert 'if-none-match' not in Handler.requests[0]
+    assert Handler.requests[1]['if-none-match']
+    assert len(list(tmp_path.iterdir())) == 2
@@ -0,0 +1,103 @@
+import time
+import tracemalloc
+
+from .. import Pair, dictcc
+from ..files import open_lines
+from ...test.conftest import benchmark
+
+def reference_read(path):
+    '''
+    dict.cc reader from before :py:class:`vortaro.formats.Pair`, which
+    made a dict for each pair
+    '''
+    with open_lines(path) as fp:
+        left_lang, right_lang = (g.lower() for g in dictcc.PAIR.match(next(fp)).groups())
+        for rawline in fp:
+            if rawline.startswith('#') or not rawline.strip():
+                continue
+            left_word, right_word, pos, *_ = rawline.split('\t')
+            yield {
+                'part_of_speech': pos,
+                'from_lang': left_lang,
+                'from_word': dictcc._truncate(left_word),
+                'to_lang': right_lang,
+                'to_word': right_word,
+            }
+            yield {
+                'part_of_speech': pos,
+                'from_lang': right_lang,
+                'from_word': dictcc._truncate(right_word),
+                'to_lang': left_lang,
+                'to_word': left_word,
+            }
+
+def _directions(pair):
+    '''
+    A translation from :py:func:`vortaro.formats.dictcc.read` as the dicts
+    that :py:func:`reference_read` made for it
+    '''
+    pair = Pair(*pair)
+    yield {
+        'part_of_speech': pair.part_of_speech,
+        'from_lang': pair.from_lang,
+        'from_word': pair.from_word,
+        'to_lang': pair.to_lang,
+        'to_word': pair.to_text or pair.to_word,
+    }
+    yield {
+        'part_of_speech': pair.part_of_speech,
+        'from_lang': pair.to_lang,
+        'from_word': pair.to_word,
+        'to_lang': pair.from_lang,
+        'to_word': pair.from_text or pair.from_word,
+    }
+
+def _dictionary(tmp_path, n):
+    path = tmp_path / 'dictionary.txt'
+    with path.open('w') as fp:
+        fp.write('# EN-RU vocabulary database\tcompiled by dict.cc\n\n')
+        for i in range(n):
+            fp.write('elephant %d {n}\tслон %d\tnoun\n' % (i, i))
+    return path
+
+def test_reference(tmp_path):
+    path = _dictionary(tmp_path, 100)
+    assert [d for pair in dictcc.read(path) for d in _directions(pair)] == \
+        list(reference_read(path))
+
+@benchmark
+def test_benchmark(tmp_path):
+    '''
+    Memory held by the records for a million definitions (translations one
+    way), as they are held in a batch, and the time to read them, with a
+    dict for each definition and with a tuple of the fields of
+    :py:class:`vortaro.formats.Pair` for each translation; run pytest with
+    -s and VORTARO_BENCHMARK set to see the numbers.
+    '''
+    n = 50000
+    path = _dictionary(tmp_path, n)
+    scale = 10 ** 6 / (2 * n)
+    for name, read in (('dict', reference_read), ('tuple', dictcc.read)):
+        records = iter(read(path))
+        first = next(records)
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            held = list(records)
+            after = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        statistics = after.compare_to(before, 'filename')
+        size = sum(s.size_diff for s in statistics)
+        blocks = sum(s.count_diff for s in statistics)
+        del held, first
+
+        best = None
+        for _ in range(3):
+            start = time.perf_counter()
+            for _ in read(path):
+                pass
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        print('%-5s %5.1f MB in %7d blocks per million definitions, read in %.2fs' % (
+            name, size * scale / 2 ** 20, blocks * scale, best * scale))
@@ -1,5 +1,15 @@
+import bz2
+import hashlib
+import logging
+import random
+import time
+from xml.sax.saxutils import escape
+
 import pytest
-from ..wiktionary import _translations
+from .. import Pair, wiktionary
+from .conftest import Handler
+from ...test.conftest import benchmark
+from ..wiktionary import _translations, read
 
 cases = (
     ('ö', '*danska: {{ö+|da|stå}}\n',
@@ -13,5 +23,217 @@ cases = (
 )
 @pytest.mark.parametrize('letter, wikiline, expected', cases)
 def test_translations(letter, wikiline, expected):
-    observed = _translations(letter).parseString(wikiline)
+    observed = _translations(letter)(wikiline)
     assert tuple(observed) == expected
+
+def _reference(t):
+    '''
+    The pyparsing grammar that _translations replaced
+    '''
+    pyparsing = pytest.importorskip('pyparsing')
+    from pyparsing import Literal, Optional, OneOrMore, SkipTo, Word, printables
+    single = (Literal('{{' + t) + Optional('+')).suppress() + OneOrMore(
+        Literal('|').suppress() + SkipTo(Literal('|') | Literal('}}').suppress())
+    ) + Literal('}}').suppress()
+    grammar = (Literal('*') + Word(printables)).suppress() + \
+        OneOrMore(single.setParseAction(_brace_chunk) + Optional(SkipTo(Literal('{{')).suppress()))
+    def translations(wikiline):
+        try:
+            return list(grammar.parseString(wikiline))
+        except pyparsing.ParseException:
+            return []
+    return translations
+
+def _brace_chunk(tokens):
+    head, *tail = tokens
+    return (head, ', '.join(tail))
+
+def _wikilines(n):
+    r = random.Random(0)
+    pieces = ('*', '**', ' ', '\t', 'danska:', 'färöiska:', ':', '{{ö+|', '{{ö|',
+              '{{ö +|', '{{m}}', '{{', '}}', '}', '|', ' | ', 'da', 'se tenir', ', ')
+    fields = ('da', ' da ', '', 'se tenir', '\tx', 'a {{b', '}', 'ö+')
+    for _ in range(n):
+        if r.random() < 0.5:
+            yield r.choice(('*', ' * ', '')) + ''.join(
+                r.choice(pieces) for _ in range(r.randint(0, 12)))
+        else:
+            templates = ('{{ö%s%s}}' % (r.choice(('+', ' +', '')), ''.join(
+                '|' + r.choice(fields) for _ in range(r.randint(0, 3))))
+                for _ in range(r.randint(1, 3)))
+            yield r.choice(('*', '* ', '**')) + r.choice(('danska:', ':', 'färöiska:')) + \
+                r.choice((' ', '', '\t')) + \
+                ''.join(r.choice(('', ', ', ' {{m}} ', '}')) + t for t in templates)
+
+@pytest.mark.filterwarnings('ignore::DeprecationWarning')
+def test_reference():
+    reference = _reference('ö')
+    translations = _translations('ö')
+    for wikiline in _wikilines(20000):
+        assert list(translations(wikiline)) == reference(wikiline), wikiline
+
+@benchmark
+@pytest.mark.filterwarnings('ignore::DeprecationWarning')
+def test_benchmark():
+    '''
+    Compares the regular expressions with the pyparsing grammar; run pytest
+    with -s and VORTARO_BENCHMARK set to see the timings.
+    '''
+    reference = _reference('ö')
+    translations = _translations('ö')
+    wikilines = ['Lorem ipsum dolor sit amet.'] * 18 + [
+        '*danska: {{ö+|da|stå}}',
+        '*franska: {{ö+|fr|se tenir}}, {{ö+|fr|être debout}}',
+    ]
+    times = []
+    for f in (reference, translations):
+        start = time.perf_counter()
+        for _ in range(200):
+            for wikiline in wikilines:
+                f(wikiline)
+        times.append(time.perf_counter() - start)
+    print('pyparsing %.0f lines/s, regular expressions %.0f lines/s' % tuple(
+        200 * len(wikilines) / seconds for seconds in times))
+
+def _dump(tmp_path, dbname, pages):
+    xml = ['<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/">',
+           '  <siteinfo>', '    <dbname>%s</dbname>' % dbname, '  </siteinfo>']
+    for title, text in pages:
+        xml.extend(('  <page>', '    <title>%s</title>' % escape(title), '    <revision>'))
+        if text is None:
+            xml.append('      <text xml:space="preserve" />')
+        else:
+            xml.append('      <text xml:space="preserve">%s</text>' % escape(text))
+        xml.extend(('    </revision>', '  </page>'))
+    xml.append('</mediawiki>\n')
+    path = tmp_path / ('%s.xml.bz2' % dbname)
+    with bz2.open(str(path), 'wt', encoding='utf-8') as fp:
+        fp.write('\n'.join(xml))
+    return path
+
+PAGES = (
+    ('Wiktionary:Main Page', 'Welcome'),
+    ('tom', None),
+    ('stå', '==Svenska==\n===Verb===\n'
+            '*danska: {{ö+|da|stå}}\n'
+            '*franska: {{ö+|fr|se tenir}}, {{ö+|fr|être debout}}\n'),
+    ('<hus>', '*tyska: {{ö+|de|Haus}}'),
+)
+EXPECTED = (
+    ('Svenska', 'stå', 'da', 'stå'),
+    ('Svenska', 'stå', 'fr', 'se tenir'),
+    ('Svenska', 'stå', 'fr', 'être debout'),
+    ('Svenska', '<hus>', 'de', 'Haus'),
+)
+
+@pytest.mark.parametrize('dbname', ('svwiktionary', 'xxwiktionary'))
+def test_read(caplog, tmp_path, dbname):
+    caplog.set_level(logging.INFO)
+    rows = list(read(_dump(tmp_path, dbname, PAGES)))
+    assert tuple(rows) == tuple(
+        Pair('', from_lang, from_word, None, to_lang, to_word, None)
+        for from_lang, from_word, to_lang, to_word in EXPECTED)
+    assert 'Read 4 pages' in caplog.text
+
+@pytest.mark.parametrize('early_pages', (1000, 1, 0))
+def test_read_early_pages(monkeypatch, tmp_path, early_pages):
+    monkeypatch.setattr(wiktionary, 'EARLY_PAGES', early_pages)
+    path = _dump(tmp_path, 'xxwiktionary', (
+        ('a', '==Norska=='),
+        ('b', '==Danska=='),
+        ('hus', '*tyska: {{ö+|de|Haus}}'),
+        ('katt', '*tyska: {{ö+|de|Katze}}'),
+    ))
+    assert list(read(path)) == [
+        Pair('', 'Danska', 'hus', None, 'de', 'Haus', None),
+        Pair('', 'Danska', 'katt', None, 'de', 'Katze', None),
+    ]
+
+def _multistream(tmp_path, dbname, pages, per_stream):
+    header = ('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/">\n'
+              '  <siteinfo>\n    <dbname>%s</dbname>\n  </siteinfo>\n' % dbname)
+    streams = [bz2.compress(header.encode('utf-8'))]
+    index = []
+    offset = len(streams[0])
+    for i in range(0, len(pages), per_stream):
+        xml = []
+        for j, (title, text) in enumerate(pages[i:i+per_stream], i):
+            index.append('%d:%d:%s\n' % (offset, j, title))
+            xml.append('  <page>\n    <title>%s</title>\n    <revision>\n'
+                       '      <text xml:space="preserve">%s</text>\n'
+                       '    </revision>\n  </page>\n' % (escape(title), escape(text)))
+        streams.append(bz2.compress(''.join(xml).encode('utf-8')))
+        offset += len(streams[-1])
+    streams.append(bz2.compress(b'</mediawiki>\n'))
+    path = tmp_path / ('%s.xml.bz2' % dbname)
+    path.write_bytes(b''.join(streams))
+    index_path = wiktionary._multistream_index(path)
+    index_path.parent.mkdir()
+    index_path.write_bytes(bz2.compress(''.join(index).encode('utf-8')))
+    return path, index_path
+
+@pytest.mark.parametrize('dbname', ('svwiktionary', 'xxwiktionary'))
+@pytest.mark.parametrize('jobs', (1, 2))
+def test_read_multistream(monkeypatch, tmp_path, dbname, jobs):
+    monkeypatch.setattr(wiktionary, 'JOBS', jobs)
+    pages = [('Wiktionary:Main Page', 'Welcome')]
+    for i in range(20):
+        pages.append(('ord%d' % i, '*danska: {{ö+|da|ord%d}}' % i))
+        if i % 7 == 0:
+            pages.append(('språk%d' % i, '==Språk%d==' % i))
+    path, index = _multistream(tmp_path, dbname, pages, 3)
+    multistream = list(read(path))
+    index.unlink()
+    single = list(read(path))
+    assert len(single) == 20
+    language = 'xx' if dbname == 'xxwiktionary' else 'sv'
+    assert single[0] == Pair('', language, 'ord0', None, 'da', 'ord0', None)
+    assert Pair(*single[-1]).from_lang == 'Språk14'
+    assert multistream == single
+
+def test_checksums():
+    text = ('0beec7b5ea3f0fdbc95d0dd47f3c5bc275da8a33  '
+            'svwiktionary-20180101-pages-articles-multistream.xml.bz2\n\n')
+    assert wiktionary._checksums(text) == {
+        'svwiktionary-20180101-pages-articles-multistream.xml.bz2':
+            '0beec7b5ea3f0fdbc95d0dd47f3c5bc275da8a33',
+    }
+
+def _wiki(wiki, dump):
+    directory = '/%s/20180101/' % wiki
+    names = ['%s-20180101-pages-articles-multistream%s' % (wiki, suffix)
+             for suffix in ('.xml.bz2', '-index.txt.bz2')]
+    files = {directory + name: dump + name.encode('utf-8') for name in names}
+    files[directory + 'sha1sums.txt'] = ''.join(
+        '%s  %s\n' % (hashlib.sha1(files[directory + name]).hexdigest(), name)
+        for name in names).encode('utf-8')
+    files[directory[:-1]] = ''.join(
+        '<a href="%s">%s</a>' % (path, path) for path in files).encode('utf-8')
+    return files
+
+def test_download(monkeypatch, server, tmp_path, capsys):
+    monkeypatch.setattr(wiktionary, 'URL', server + '/backup-index.html')
+    monkeypatch.setitem(Handler.files, '/backup-index.html',
+        b'<a href="svwiktionary/20180101">svwiktionary</a>'
+        b'<a href="eowiktionary/20180101">eowiktionary</a>')
+    for wiki in ('sv', 'eo'):
+        Handler.files.update(_wiki(wiki + 'wiktionary', b'dump'))
+
+    wiktionary.download(tmp_path)
+    assert (tmp_path / 'svwiktionary.xml.bz2').read_bytes() == \
+        b'dumpsvwiktionary-20180101-pages-articles-multistream.xml.bz2'
+    assert wiktionary._multistream_index(tmp_path / 'eowiktionary.xml.bz2').exists()
+    assert sorted(request['status'] for request in Handler.requests) \
+        == [200] * 9
+
+    del Handler.requests[:]
+    wiktionary.download(tmp_path)
+    assert [request['status'] for request in Handler.requests] == [304] * 5
+
+    del Handler.requests[:]
+    Handler.files.update(_wiki('svwiktionary', b'new dump'))
+    wiktionary.download(tmp_path)
+    assert (tmp_path / 'svwiktionary.xml.bz2').read_bytes() == \
+        b'new dumpsvwiktionary-20180101-pages-articles-multistream.xml.bz2'
+    assert sorted(request['status'] for request in Handler.requests) \
+        == [200] * 3 + [304] * 4
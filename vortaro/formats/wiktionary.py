@@ -1,21 +1,50 @@
+import pickle
 import re
-import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from io import BytesIO
+from itertools import chain
+from logging import getLogger
+from multiprocessing import Pool, cpu_count, current_process
+from os import makedirs
+from pathlib import Path
+from tempfile import TemporaryFile
+from time import perf_counter
 from urllib.parse import urlsplit
-from bz2 import BZ2File
-from xml.etree import ElementTree
+from bz2 import BZ2File, decompress
+from xml.etree.ElementTree import iterparse
 
 import lxml.html
-from pyparsing import (
-    Literal, Optional, OneOrMore, NotAny, SkipTo,
-    ParseException,
-    printables, Word, LineEnd,
-)
 
-from .http import get
+from .files import open_binary
+from .http import get, download as download_file
+
+logger = getLogger(__name__)
 
 URL = 'https://dumps.wikimedia.org/backup-index.html'
-TRANSLATION_PLUS = re.compile(r'.*{{(.)\+\|.*')
+TRANSLATION_PLUS = re.compile(r'{{(.)\+\|')
 THIS_LANGUAGE = re.compile(r'^==([^=]+)==')
+MEDIAWIKI = re.compile(rb'<mediawiki[^>]*>|</mediawiki>')
+
+# Translation lines, for _translations: a bullet, a word of printable ASCII
+# characters and then templates, the first right after the word. A field
+# ends where a bar or the end of the template follows, perhaps after
+# spaces, which are left out of the field.
+BULLET = re.compile(r'[ \r\n]*\*[ \r\n]*[!-~]+(?![!-~])[ \r\n]*')
+_FIELD = r'(?:(?![ \r\n]*(?:\||}}))[^\n])*'
+TEMPLATE = r'{{%s(?:[ \r\n]*\+)?((?:[ \r\n]*\|' + _FIELD + r')+)[ \r\n]*}}'
+FIELD = re.compile(r'[ \r\n]*\|(' + _FIELD + ')')
+NEXT_TEMPLATE = re.compile(r'(?={{)')
+
+# Translation template letters of wikis, by database name
+TEMPLATES = {
+    'svwiktionary': 'ö',
+}
+EARLY_PAGES = 1000
+REPORT = 100000
+JOBS = cpu_count()
+THREADS = 4
 
 def hrefs(r, xpath):
     html = lxml.html.fromstring(r.content)
@@ -23,96 +52,352 @@ def hrefs(r, xpath):
     return html.xpath(xpath)
 
 def download(directory):
-    basename = '%s.html.p' % datetime.date.today()
-    r = get(URL, directory / 'index' / basename)
-    for index in hrefs(r, '//a[contains(text(), "wiktionary")]/@href'):
-        path = directory / 'subindex' / urlsplit(index).path[1:] / basename
-        r = get(index, path)
-        for dump in hrefs(r, '//a[contains(@href, "pages-meta-current.xml.bz2")]/@href'):
-            bz2 = directory / ('%s.xml.bz2' % urlsplit(index).path.split('/')[1])
-            if not bz2.exists():
-                print(bz2)
-                r = get(dump)
-                with bz2.open('wb') as fp:
-                    fp.write(r.content)
+    '''
+    Download the multistream dump of each Wiktionary and its index, THREADS
+    at a time. Index pages are cached in the http directory and revalidated,
+    and a dump is downloaded again only if its published checksum changes.
+    '''
+    cache = directory / 'http'
+    r = get(URL, cache)
+    with ThreadPoolExecutor(THREADS) as executor:
+        dumps = executor.map(partial(_dumps, directory, cache),
+                             hrefs(r, '//a[contains(text(), "wiktionary")]/@href'))
+        dumps = [dump for wiki in dumps for dump in wiki]
+        for _ in executor.map(partial(_download_dump, directory), dumps):
+            pass
+
+def _dumps(directory, cache, index):
+    '''
+    :param str index: URL of the page for the latest dumps of one wiki
+    :returns: URLs, paths and checksums of the files to download
+    '''
+    r = get(index, cache)
+    bz2 = directory / ('%s.xml.bz2' % urlsplit(index).path.split('/')[1])
+    checksums = {}
+    for sums in hrefs(r, '//a[contains(@href, "sha1sums.txt")]/@href'):
+        checksums = _checksums(get(sums, cache).content.decode('utf-8'))
+        break
+    dumps = []
+    for suffix, path in (
+            ('pages-articles-multistream.xml.bz2', bz2),
+            ('pages-articles-multistream-index.txt.bz2', _multistream_index(bz2))):
+        for dump in hrefs(r, '//a[contains(@href, "%s")]/@href' % suffix):
+            checksum = checksums.get(urlsplit(dump).path.rpartition('/')[2])
+            if not path.exists() or (
+                    checksum and checksum != _read_checksum(directory, path)):
+                dumps.append((dump, path, checksum))
             break
+    return dumps
+
+def _download_dump(directory, dump):
+    url, path, checksum = dump
+    print(path)
+    download_file(url, path, checksum and ('sha1', checksum))
+    if checksum:
+        sidecar = _checksum_path(directory, path)
+        makedirs(sidecar.parent, exist_ok=True)
+        sidecar.write_text(checksum)
+
+def _checksum_path(directory, path):
+    return directory / 'checksums' / (path.name + '.sha1')
+
+def _read_checksum(directory, path):
+    sidecar = _checksum_path(directory, path)
+    if sidecar.exists():
+        return sidecar.read_text()
+
+def _checksums(text):
+    '''
+    :param str text: List of checksums, like the output of sha1sum
+    :returns: Checksums by file name
+    '''
+    checksums = {}
+    for line in text.splitlines():
+        checksum, _, name = line.partition('  ')
+        if name:
+            checksums[name] = checksum
+    return checksums
 
 def read(path):
     '''
-    Read a dictionary file
+    Read a dictionary file. If the index of a multistream dump is in
+    the multistream-index directory beside it, the streams are read in
+    several processes.
 
     :param pathlib.Path: Dictionary file
+    :returns: Tuples of the fields of :py:class:`vortaro.formats.Pair`
+    '''
+    this_language = path.name[:2] # default from file name
+    index = _multistream_index(path)
+    if index.exists():
+        yield from _read_multistream(path, index, this_language)
+    else:
+        with open_binary(path) as fp:
+            yield from _read(fp, this_language)
+
+def _read(fp, this_language):
     '''
+    Read definitions from a dump in one pass.
+
+    :param fp: Binary file of the XML dump
+    :param str this_language: Language until a page names one
+    '''
+    siteinfo = {}
+    pages = _progress(_pages(fp, siteinfo))
+    letter, early = _detect(pages, siteinfo)
+    if letter is not None:
+        t = _translations(letter)
+        for page in chain(early, pages):
+            rows, this_language = _rows(t, (page,), this_language)
+            yield from _definitions(rows)
+
+def _read_multistream(path, index, this_language):
+    '''
+    Read definitions from a multistream dump, decompressing and parsing the
+    streams in a pool of processes. Definitions are yielded in the order
+    of the dump, as if it had been read in one pass.
+
+    :param pathlib.Path path: Multistream dump
+    :param pathlib.Path index: Its index of stream offsets
+    :param str this_language: Language until a page names one
+    '''
+    segments = _segments(path, index)
+    siteinfo = {}
+    letter = TEMPLATES.get(_header(path, segments[0], siteinfo).get('dbname'))
+    if letter is None:
+        # Only the streams up to the first page that uses the template are
+        # decompressed here as well.
+        pages = chain.from_iterable(
+            _stream_pages(path, segment) for segment in segments)
+        letter = next(filter(None, (_template(text) for _, text in pages)), None)
+        if letter is None:
+            return
+
+    tasks = [(str(path), start, end, letter) for start, end in segments]
+    if current_process().daemon:
+        # Processes of a pool cannot have children.
+        results = map(_stream, tasks)
+        yield from _multistream_definitions(results, this_language)
+    else:
+        with Pool(JOBS) as pool:
+            yield from _multistream_definitions(
+                _ordered(pool, _stream, tasks, 2 * JOBS), this_language)
+
+def _multistream_definitions(results, this_language):
+    start = perf_counter()
+    count = 0
+    for pages, rows, last_language in results:
+        for row in rows:
+            if row[0] is None:
+                row = (this_language,) + row[1:]
+            yield from _definitions((row,))
+        this_language = last_language or this_language
+        count += pages
+    _report(count, start)
+
+def _ordered(pool, f, tasks, window):
+    '''
+    Like :py:meth:`multiprocessing.pool.Pool.imap` but with at most window
+    results waiting, so they do not pile up when they are consumed slowly
+    '''
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.apply_async(f, (task,)))
+        if len(pending) == window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def _stream(task):
+    '''
+    Read definitions from one segment of a multistream dump, in a worker
+    process. The language is None until a page in the segment names one.
+
+    :returns: Number of pages, rows, and the last language named
+    '''
+    path, start, end, letter = task
+    pages = _stream_pages(Path(path), (start, end))
+    rows, last_language = _rows(_translations(letter), pages, None)
+    return len(pages), rows, last_language
+
+def _multistream_index(path):
+    return path.parent / 'multistream-index' / \
+        path.name.replace('.xml.bz2', '-index.txt.bz2')
+
+def _segments(path, index):
+    '''
+    :returns: Start and end offsets of the header and of each stream
+    '''
+    with BZ2File(str(index)) as fp:
+        offsets = sorted({int(line.split(b':', 1)[0]) for line in fp})
+    size = path.stat().st_size
+    offsets = [0] + [offset for offset in offsets if 0 < offset < size] + [size]
+    return list(zip(offsets, offsets[1:]))
+
+def _header(path, segment, siteinfo):
+    for _ in _stream_pages(path, segment, siteinfo):
+        pass
+    return siteinfo
+
+def _stream_pages(path, segment, siteinfo=None):
+    '''
+    Decompress and parse a segment of a multistream dump. Segments hold whole
+    pages, and the first and last also hold the start and end of the root
+    element, so the root element is replaced to make a document.
+    '''
+    start, end = segment
     with path.open('rb') as fp:
-        with BZ2File(fp) as gp:
-            t = None
-            this_word = None
-            line = b''
-            this_language = path.name[:2] # default from file name
+        fp.seek(start)
+        xml = decompress(fp.read(end - start))
+    xml = MEDIAWIKI.sub(b'', xml)
+    document = BytesIO(b'<mediawiki>' + xml + b'</mediawiki>')
+    return list(_pages(document, {} if siteinfo is None else siteinfo))
+
+def _detect(pages, siteinfo):
+    '''
+    Find the translation template, from the site or from the first page
+    that uses it. Pages before it are kept so that they can be read once it
+    is known, the first EARLY_PAGES in memory and the rest in a temporary
+    file.
+
+    :param pages: Iterator of pages, which is read until the template is found
+    :returns: The template letter or None, and an iterator of the pages up
+        to and including the one where it was found
+    '''
+    early = []
+    spool = None
+    try:
+        for page in pages:
+            letter = TEMPLATES.get(siteinfo.get('dbname')) or _template(page[1])
+            if letter is not None:
+                early.append(page)
+                pages = _early(early, spool)
+                spool = None
+                return letter, pages
+            elif len(early) < EARLY_PAGES:
+                early.append(page)
+            else:
+                if spool is None:
+                    spool = TemporaryFile()
+                pickle.dump(page, spool, pickle.HIGHEST_PROTOCOL)
+        return None, iter(())
+    finally:
+        if spool is not None:
+            spool.close()
+
+def _early(early, spool):
+    '''
+    :param list early: Pages kept in memory, the last of which comes after
+        the spooled ones
+    :param spool: Temporary file of pickled pages, or None
+    '''
+    *head, last = early
+    yield from head
+    if spool is not None:
+        with spool:
+            spool.seek(0)
             while True:
-                if this_word == None:
-                    if line.startswith(b'    <title>'):
-                        this_word = _text(line)
-                    line = next(gp)
-                elif line == b'      <text xml:space="preserve" />\n':
-                    this_word = None
-                    line = next(gp)
-                elif line.startswith(b'      <text'):
-                    buf = line
-                    while not line.endswith(b'</text>\n'):
-                        line = next(gp)
-                        buf += line
-                    line = next(gp)
-                    wikilines = _text(buf).split('\n')
-                    if t:
-                        for wikiline in wikilines:
-                            m = re.match(THIS_LANGUAGE, wikiline)
-                            if m:
-                                this_language = m.group(1)
-                                continue
-
-                            try:
-                                translations = t.parseString(wikiline)
-                            except ParseException:
-                                pass
-                            else:
-                                for that_language, that_word in translations:
-                                    yield {
-                                        'part_of_speech': '',
-                                        'from_lang': this_language,
-                                        'from_word': this_word,
-                                        'to_lang': that_language,
-                                        'to_word': that_word,
-                                    }
-                                    yield {
-                                        'part_of_speech': '',
-                                        'from_lang': that_language,
-                                        'from_word': that_word,
-                                        'to_lang': this_language,
-                                        'to_word': this_word,
-                                    }
-                    else:
-                        for wikiline in wikilines:
-                            m = re.match(TRANSLATION_PLUS, wikiline)
-                            if m:
-                                t = _translations(m.group(1))
-                                line = b''
-                                gp.seek(0)
-                    this_word = None
-                else:
-                    line = next(gp)
-    exit()
-
-def _text(x):
-    return ElementTree.fromstring(x).text
+                try:
+                    yield pickle.load(spool)
+                except EOFError:
+                    break
+    yield last
 
+def _rows(t, pages, this_language):
+    '''
+    :returns: Language, word, other language and other word of each
+        translation, and the language at the end of the pages
+    '''
+    rows = []
+    for this_word, text in pages:
+        if not text:
+            continue
+        for wikiline in text.split('\n'):
+            m = re.match(THIS_LANGUAGE, wikiline)
+            if m:
+                this_language = m.group(1)
+                continue
+
+            for that_language, that_word in t(wikiline):
+                rows.append((this_language, this_word, that_language, that_word))
+    return rows, this_language
+
+def _definitions(rows):
+    for this_language, this_word, that_language, that_word in rows:
+        yield ('', this_language, this_word, None, that_language, that_word, None)
+
+def _pages(fp, siteinfo):
+    '''
+    Parse a dump incrementally, discarding each page once it has been read.
+
+    :param fp: Binary file of the XML dump
+    :param dict siteinfo: Filled in with the fields of the siteinfo
+    :returns: Title and text (or None) of each page
+    '''
+    events = iterparse(fp, events=('start', 'end'))
+    _, root = next(events)
+    title = text = None
+    for event, element in events:
+        if event == 'start':
+            continue
+        tag = element.tag.rpartition('}')[2]
+        if tag == 'title':
+            title = element.text
+        elif tag == 'text':
+            text = element.text
+        elif tag == 'page':
+            yield title, text
+            title = text = None
+            root.clear()
+        elif tag == 'siteinfo':
+            siteinfo.update((child.tag.rpartition('}')[2], child.text)
+                            for child in element)
+
+def _progress(pages):
+    '''
+    Log how quickly pages are read.
+    '''
+    start = perf_counter()
+    count = 0
+    for count, page in enumerate(pages, 1):
+        yield page
+        if count % REPORT == 0:
+            _report(count, start)
+    _report(count, start)
+
+def _report(count, start):
+    seconds = perf_counter() - start
+    logger.info('Read %d pages in %.1f seconds (%.0f pages/s)' % (
+        count, seconds, count / seconds if seconds else 0))
+
+def _template(text):
+    m = TRANSLATION_PLUS.search(text or '')
+    if m:
+        return m.group(1)
+
+@lru_cache(None)
 def _translations(t):
-    single = (Literal('{{' + t) + Optional('+')).suppress() + OneOrMore(
-        Literal('|').suppress() + SkipTo(Literal('|') | Literal('}}').suppress())
-    ) + Literal('}}').suppress()
-    return (Literal('*') + Word(printables)).suppress() + \
-        OneOrMore(single.setParseAction(_brace_chunk) + Optional(SkipTo(Literal('{{')).suppress()))
-
-def _brace_chunk(tokens):
-    head, *tail = tokens
-    return (head, ', '.join(tail))
+    '''
+    Make a function that finds the translations in a line of wikitext, like
+    "*danska: {{ö+|da|stå}}, {{ö+|da|stå upp}}", as pairs of language and
+    word. Lines without the template are passed over before any regular
+    expression is tried.
+
+    :param str t: Template letter
+    '''
+    marker = '{{' + t
+    template = re.compile(TEMPLATE % re.escape(t))
+    def translations(wikiline):
+        if marker not in wikiline:
+            return ()
+        wikiline = wikiline.expandtabs()
+        m = BULLET.match(wikiline)
+        results = []
+        while m:
+            m = template.match(wikiline, m.end())
+            if m:
+                head, *tail = FIELD.findall(m.group(1))
+                results.append((head, ', '.join(tail)))
+                m = NEXT_TEMPLATE.search(wikiline, m.end())
+        return results
+    return translations
@@ -14,7 +14,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from functools import partial
+from functools import lru_cache
 from logging import getLogger
 
 from .transliterate import get_alphabet
@@ -27,6 +27,7 @@ BOLD = '\033[1m'
 NORMAL = '\033[0m'
 HIGHLIGHT_COUNT = len(BOLD + UNDERLINE + NORMAL + BOLD + NORMAL)
 QUIET_COUNT = 0
+ALIGNMENTS = 4096
 
 def quiet(x):
     return x
@@ -39,11 +40,13 @@ def highlight(language_code, big_foreign, big_roman, small_roman, _tuple=False):
     :param bool _tuple: Return a tuple for testing
     '''
     alphabet = get_alphabet(language_code)
-    f = partial(_highlight, alphabet, big_foreign, small_roman)
-    if small_roman.lower() in big_roman.lower():
-        y = f(big_roman)
-    elif (big_foreign != big_roman) and (small_roman.lower() in big_foreign.lower()):
-        y = f(big_foreign)
+    small_lower = small_roman.lower()
+    y = None
+    if small_lower in big_roman.lower():
+        y = _highlight(alphabet, big_foreign, big_roman, small_roman)
+    elif (big_foreign != big_roman) and (small_lower in big_foreign.lower()):
+        y = _split(big_foreign, big_foreign.lower().index(small_lower),
+                   len(small_roman))
     else:
         logger.debug('Could not highlight: small_roman text not found')
 
@@ -59,14 +62,33 @@ def highlight(language_code, big_foreign, big_roman, small_roman, _tuple=False):
             a, b, c = y
             return BOLD + a + UNDERLINE + b + NORMAL + BOLD + c + NORMAL
 
-def _highlight(alphabet, big_foreign, small_roman, big_roman):
+def _highlight(alphabet, big_foreign, big_roman, small_roman):
+    '''
+    Split the foreign text where the transliteration of the match starts and
+    ends, if those are boundaries between transliterated characters
+    '''
     left = big_roman.lower().index(small_roman.lower())
     right = left + len(small_roman)
-    
-    y = (
-        alphabet.from_roman(big_roman[:left]),
-        alphabet.from_roman(big_roman[left:right]),
-        alphabet.from_roman(big_roman[right:]),
-    )
-    if ''.join(y) == big_foreign:
-        return y
+    if big_foreign == big_roman:
+        return _split(big_foreign, left, len(small_roman))
+
+    roman, offsets = _alignment(alphabet, big_foreign)
+    if roman == big_roman:
+        if left in offsets and right in offsets:
+            return _split(big_foreign, offsets[left], offsets[right] - offsets[left])
+    else:
+        # The transliteration was not made with this alphabet.
+        y = (
+            alphabet.from_roman(big_roman[:left]),
+            alphabet.from_roman(big_roman[left:right]),
+            alphabet.from_roman(big_roman[right:]),
+        )
+        if ''.join(y) == big_foreign:
+            return y
+
+@lru_cache(ALIGNMENTS)
+def _alignment(alphabet, big_foreign):
+    return alphabet.to_roman(big_foreign), alphabet.to_roman.align(big_foreign)
+
+def _split(text, start, length):
+    return text[:start], text[start:start+length], text[start+length:]
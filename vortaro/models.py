@@ -14,27 +14,43 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import sqlite3
+from datetime import datetime
+from functools import lru_cache, partial
+from hashlib import blake2b, sha1
+from io import StringIO
+from itertools import islice
+from logging import getLogger
 from pathlib import Path
+from urllib.parse import quote
+from uuid import uuid4
 
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.event import listen
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.schema import CreateColumn
 from sqlalchemy.orm.exc import NoResultFound
-from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
 from sqlalchemy.orm import (
     sessionmaker,
-    column_property, synonym,
+    column_property,
     relationship, backref,
 )
-from sqlalchemy.sql import func
+from sqlalchemy.sql import (
+    func, table, column, select, exists, and_, literal, union, union_all,
+)
 from sqlalchemy import (
-    create_engine, CheckConstraint,
+    create_engine, CheckConstraint, UniqueConstraint,
     Column, ForeignKey, Index,
-    String, Integer, DateTime,
+    String, Integer, BigInteger, DateTime,
 )
 
 from .highlight import highlight
-from .transliterate import get_alphabet
+from .transliterate import get_alphabet, fold
+
+logger = getLogger(__name__)
 
 Base = declarative_base()
 
@@ -54,12 +70,143 @@ def get_or_create(session, model, tries=1, **kwargs):
                 if i == tries:
                     raise
 
+# Settings for connections to SQLite files. Indexing writes the journal
+# ahead (WAL), which lets searches read while an index job is writing, and
+# does not wait for the disk, as an interrupted index can be run again.
+# Searching opens the file read-only and maps it into memory.
+SQLITE_PROFILES = {
+    'index': (
+        'PRAGMA journal_mode = WAL',
+        'PRAGMA synchronous = OFF',
+        'PRAGMA cache_size = -65536',
+        'PRAGMA temp_store = MEMORY',
+    ),
+    'serve': (
+        'PRAGMA mmap_size = 268435456',
+        'PRAGMA query_only = ON',
+    ),
+}
+SQLITE_TIMEOUT = 10
+
+def Engine(x, profile=None, upgrade=False):
+    '''
+    Connect to a database, creating the tables if it has none; see
+    :py:func:`check_schema`
+
+    :param profile: On SQLite, 'index' for loading definitions or 'serve'
+        for searching, or None for the default settings
+    :param upgrade: Rebuild the tables of a database from an older version
+        of vortaro, which drops its definitions, rather than raising
+        :py:class:`SchemaError`
+    '''
+    url = make_url(x)
+    path = _sqlite_path(url)
+    if path:
+        # Keep connections to database files, as for other databases; the
+        # pool hands each connection to one thread at a time.
+        kwargs = dict(poolclass=QueuePool, connect_args={
+            'check_same_thread': False,
+            'timeout': SQLITE_TIMEOUT,
+        })
+        if profile == 'serve':
+            kwargs['creator'] = partial(sqlite3.connect,
+                'file:%s?mode=ro' % quote(path), uri=True, **kwargs['connect_args'])
+        engine = create_engine(url, **kwargs)
+        if profile:
+            listen(engine, 'connect', partial(_pragmas, SQLITE_PROFILES[profile]))
+    else:
+        engine = create_engine(url)
+    check_schema(engine, writable=profile != 'serve', upgrade=upgrade)
+    return engine
+
+def _sqlite_path(url):
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+        return url.database
+
+def has_profiles(x):
+    '''
+    Whether :py:func:`Engine` would apply profiles to a database URL
+    '''
+    return bool(_sqlite_path(make_url(x)))
+
+def _pragmas(pragmas, connection, record):
+    cursor = connection.cursor()
+    for pragma in pragmas:
+        cursor.execute(pragma)
+    cursor.close()
+
 def SessionMaker(x):
-    engine = create_engine(x)
-    Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=Engine(x))
     return Session()
 
+# Increase this whenever the tables change. Databases from older versions
+# are rebuilt, except for the history, when they are next indexed.
+SCHEMA = 3
+
+class SchemaError(Exception):
+    '''
+    The database is from another version of vortaro.
+    '''
+
+def schema_version(engine):
+    '''
+    Schema version recorded in the database, or None if it has no meta
+    table (an empty database, or one from vortaro 1.0) or no version
+    '''
+    with engine.connect() as connection:
+        if not engine.dialect.has_table(connection, Meta.__tablename__):
+            return None
+        version = connection.execute(select([Meta.value]) \
+            .where(Meta.key == 'schema')).scalar()
+    return None if version is None else int(version)
+
+def check_schema(engine, writable=True, upgrade=False):
+    '''
+    Make sure that the tables are those of this version. The tables of an
+    empty database are created, but the definitions in a database from an
+    older version are dropped only with upgrade, which indexing sets.
+
+    :param writable: Whether the tables may be created
+    :param upgrade: Rebuild the tables of a database from an older version
+    :raises SchemaError: If the database is from a newer version, or from
+        an older version without upgrade
+    '''
+    version = schema_version(engine)
+    if version == SCHEMA:
+        return
+    elif version is not None and version > SCHEMA:
+        raise SchemaError('%s is from a newer version of vortaro (schema %d, '
+                          'and this version has %d)' % (engine.url, version, SCHEMA))
+    with engine.connect() as connection:
+        empty = not engine.dialect.has_table(connection, Dictionary.__tablename__)
+    if writable and (empty or upgrade):
+        if not empty:
+            logger.warning('Rebuilding %s, which is from an older version of '
+                           'vortaro; its dictionaries will be indexed again' % engine.url)
+        migrate(engine)
+    else:
+        raise SchemaError('%s is from an older version of vortaro; index the '
+                          'dictionaries again to rebuild it' % engine.url)
+
+def migrate(engine):
+    '''
+    Create the tables, replacing tables from other versions of the schema
+    except for the history. Dictionaries must then be indexed again.
+    '''
+    logger.info('Creating the database tables')
+    tables = [table for table in Base.metadata.sorted_tables
+              if table is not History.__table__]
+    with engine.begin() as connection:
+        if engine.dialect.name == 'sqlite':
+            for name in (TRIGRAM_VOCAB.name, TRIGRAM.name) + OLD_TRIGRAM_TABLES:
+                connection.execute('DROP TABLE IF EXISTS %s' % name)
+        Base.metadata.drop_all(connection, tables=tables)
+        Base.metadata.create_all(connection)
+    create_trigram_index(engine)
+    with engine.begin() as connection:
+        connection.execute(Meta.__table__.insert(),
+                           {'key': 'schema', 'value': str(SCHEMA)})
+
 @compiles(CreateColumn, 'postgresql')
 def use_identity(element, compiler, **kw):
     text = compiler.visit_create_column(element, **kw)
@@ -69,14 +216,42 @@ def use_identity(element, compiler, **kw):
 def whole_number(name):
     return Column(Integer, CheckConstraint('%s >= 0' % name), nullable=False)
 
+# Search keys compare by code point, so that prefix searches can be range
+# scans; PostgreSQL would otherwise use the locale's collation.
+Key = String().with_variant(String(collation='C'), 'postgresql')
+
 class History(Base):
     __tablename__ = 'history'
     id = Column(Integer, primary_key=True)
-    datetime = Column(DateTime, nullable=False, default='now')
+    datetime = Column(DateTime, nullable=False, default=datetime.now)
     text = Column(String, nullable=False)
     total_results = whole_number('total_results')
     displayed_results = whole_number('displayed_results')
 
+class Meta(Base):
+    '''
+    Settings and counters for the database as a whole
+    '''
+    __tablename__ = 'meta'
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=False)
+
+def generation(session):
+    '''
+    Token that changes whenever the definitions change, so that cached
+    search results can tell that they are stale. It is random rather than a
+    counter so that it also changes if the database is rebuilt.
+    '''
+    return session.query(Meta.value).filter(Meta.key == 'generation').scalar() or ''
+
+def bump_generation(session):
+    m = Meta.__table__
+    value = uuid4().hex
+    result = session.execute(m.update().where(m.c.key == 'generation'),
+                             {'value': value})
+    if not result.rowcount:
+        session.execute(m.insert(), {'key': 'generation', 'value': value})
+
 class Format(Base):
     __tablename__ = 'format'
     id = Column(Integer, primary_key=True)
@@ -85,20 +260,135 @@ class Format(Base):
 def _mtime(path):
     return int(Path(path).stat().st_mtime)
 
+def _digest(path):
+    h = sha1()
+    with Path(path).open('rb') as fp:
+        for block in iter(partial(fp.read, 1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
 class File(Base):
     __tablename__ = 'file'
     id = Column(Integer, primary_key=True)
     path = Column(String, unique=True)
     mtime = Column(Integer, nullable=False, default=int)
+    digest = Column(String, nullable=True)
     format_id = Column(ForeignKey(Format.id), nullable=False)
     format = relationship(Format)
 
     @property
     def out_of_date(self):
         return self.mtime < _mtime(self.path)
-    def update(file, read, session, chunksize):
-        get_pos = table_dict(PartOfSpeech, 'text')
-        get_lang = table_dict(Language, 'code')
+    def update(file, read, session, chunksize, refresh=False):
+        '''
+        Bring the definitions up to date with the file. Nothing happens
+        if the contents have not changed, unless refresh is set.
+        '''
+        path = Path(file.path)
+        digest = _digest(path)
+        if digest == file.digest and not refresh:
+            file.unchanged(session)
+        else:
+            loader = Loader(session, file)
+            for rows in chunks(prepare(read, path), chunksize):
+                loader(rows)
+            loader.close(digest)
+    def unchanged(file, session):
+        file.mtime = _mtime(file.path)
+        session.add(file)
+        session.commit()
+
+def prepare(read, path):
+    '''
+    Read a dictionary file into rows for :py:class:`Loader`, transliterating
+    the words, making their search keys and hashing each row. This is the
+    CPU-bound part of indexing.
+
+    Each row holds a translation in both directions. Its two sides are put
+    in a fixed order, so that a translation that is read once each way is
+    stored once.
+
+    :param read: Format reader function, which yields tuples of the fields
+        of :py:class:`vortaro.formats.Pair`
+    :param pathlib.Path path: Dictionary file
+    '''
+    for pos, from_lang, from_word, from_text, to_lang, to_word, to_text in read(path):
+        left = _side(from_lang, from_word, from_text)
+        right = _side(to_lang, to_word, to_text)
+        if _order(right) < _order(left):
+            left, right = right, left
+        row = (pos,) + left + right
+        yield (_hash(row),) + row
+
+def _side(lang, word, text):
+    '''
+    Language, word, text, transliteration and search keys of one side of a
+    translation, in the order of :py:data:`SIDE_COLUMNS`
+    '''
+    columns = _word(lang, word)
+    return columns[:2] + (None if text == word else text,) + columns[2:]
+
+WORDS = 100000
+@lru_cache(WORDS)
+def _word(lang, word):
+    '''
+    A word in the order of :py:data:`WORD_COLUMNS`. Words recur, within a
+    file and between files, so they are remembered.
+    '''
+    roman = get_alphabet(lang).to_roman(word)
+    key = fold(word)
+    if word == roman:
+        roman = None
+        roman_key = None
+        roman_key_reversed = None
+    else:
+        roman_key = fold(roman)
+        roman_key_reversed = roman_key[::-1]
+    return (lang, word, roman, key, roman_key, key[::-1], roman_key_reversed)
+
+def _order(side):
+    lang, word, text = side[:3]
+    return lang, word, text or ''
+
+def _hash(row):
+    '''
+    Stable 64-bit hash of a row from :py:func:`prepare`, which identifies
+    the definition across versions of its file
+    '''
+    text = '\x1f'.join('\x00' if x is None else x for x in row)
+    digest = blake2b(text.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+def chunks(xs, size):
+    xs = iter(xs)
+    while True:
+        chunk = list(islice(xs, size))
+        if chunk:
+            yield chunk
+        else:
+            break
+
+class Loader(object):
+    '''
+    Update the definitions of a file from rows made by :py:func:`prepare`,
+    one batch at a time. Batches go to a staging table through Core
+    executemany (or COPY on PostgreSQL) and are never ORM objects, so memory
+    use depends on the batch size and not on the size of the file. Closing
+    the loader then applies only the difference between the staged rows and
+    the definitions already in the database, matched by their hashes.
+    Identical definitions within a file have the same hash and are stored
+    once, from the first line that has them.
+
+    :param lookups: From :py:func:`lookup_tables`, to share between
+        loaders whose batches are interleaved in one session, so that they
+        do not both create the same part of speech or language
+    '''
+    def __init__(self, session, file, lookups=None):
+        self._session = session
+        self._file = file
+        self._file_id = file.id
+        self._index = 0
+        self._get_pos, self._get_lang = lookups or lookup_tables(session)
 
         # If the database allows it, disable constraints during insert
         try:
@@ -106,39 +396,171 @@ class File(Base):
         except OperationalError:
             pass
 
-        file.definitions[:] = []
-        session.flush()
-        for index, pair in enumerate(read(Path(file.path))):
-            alphabet = get_alphabet(pair['from_lang'])
-            from_orig = pair['from_word']
-            from_roman = alphabet.to_roman(pair['from_word'])
-            if from_orig == from_roman:
-                from_roman = None
-            file.definitions.append(Dictionary(
-                file=file, index=index,
-                part_of_speech=get_pos(session, pair.get('part_of_speech', '')),
-                from_lang=get_lang(session, pair['from_lang']),
-                from_original=from_orig,
-                from_roman_transliteration=from_roman,
-                to_lang=get_lang(session, pair['to_lang']),
-                to_word=pair['to_word'],
+        # Left over from an interrupted run
+        session.execute(Staging.__table__.delete() \
+            .where(Staging.file_id == self._file_id))
+
+    def __call__(self, rows):
+        get_pos = self._get_pos
+        get_lang = self._get_lang
+        file_id = self._file_id
+        start = self._index
+        self._index += len(rows)
+        width = len(SIDE_COLUMNS)
+        insert(self._session, Staging.__table__, LOADER_COLUMNS, (
+            (file_id, index, digest, get_pos(pos),
+             get_lang(row[0]), *row[1:width],
+             get_lang(row[width]), *row[width+1:])
+            for index, (digest, pos, *row) in enumerate(rows, start)
+        ))
+        self._session.commit()
+
+    def close(self, digest):
+        session = self._session
+        file_id = self._file_id
+        d = Dictionary.__table__
+        s = Staging.__table__
+        w = Word.__table__
+
+        removed = session.execute(d.delete().where(and_(
+            d.c.file_id == file_id,
+            ~exists().where(and_(s.c.file_id == file_id, s.c.hash == d.c.hash)),
+        ))).rowcount
+        if removed:
+            session.execute(w.delete().where(and_(
+                ~exists().where(d.c.from_word_id == w.c.id),
+                ~exists().where(d.c.to_word_id == w.c.id),
+            )))
+
+        # Words that are not yet in the word table
+        staged = union(*(
+            select([s.c[side + '_' + column].label(column) for column in WORD_COLUMNS]) \
+                .where(s.c.file_id == file_id)
+            for side in ('from', 'to')
+        )).alias('staged')
+        session.execute(w.insert().from_select(WORD_COLUMNS,
+            select([staged.c[column] for column in WORD_COLUMNS]).where(
+                ~exists().where(and_(w.c.lang_id == staged.c.lang_id,
+                                     w.c.original == staged.c.original)))
+        ))
+
+        first = select([func.min(s.c['index'])]) \
+            .where(s.c.file_id == file_id).group_by(s.c.hash)
+        from_word = w.alias('from_word')
+        to_word = w.alias('to_word')
+        added = session.execute(d.insert().from_select(DICTIONARY_COLUMNS,
+            select([
+                s.c.file_id, s.c['index'], s.c.hash, s.c.part_of_speech_id,
+                from_word.c.id, s.c.from_text, to_word.c.id, s.c.to_text,
+            ]).select_from(s \
+                .join(from_word, and_(from_word.c.lang_id == s.c.from_lang_id,
+                                      from_word.c.original == s.c.from_original)) \
+                .join(to_word, and_(to_word.c.lang_id == s.c.to_lang_id,
+                                    to_word.c.original == s.c.to_original))
+            ).where(and_(
+                s.c.file_id == file_id,
+                s.c['index'].in_(first),
+                ~exists().where(and_(d.c.file_id == file_id, d.c.hash == s.c.hash)),
             ))
-            if (index % chunksize) == 0:
-                session.commit()
+        )).rowcount
+
+        # The definitions of the file are now the distinct staged rows, and
+        # each counts for both directions.
+        st = Statistic.__table__
+        session.execute(st.delete().where(st.c.file_id == file_id))
+        pairs = select([s.c.from_lang_id, s.c.to_lang_id,
+                        func.count(s.c.hash.distinct()).label('count')]) \
+            .where(s.c.file_id == file_id) \
+            .group_by(s.c.from_lang_id, s.c.to_lang_id).alias('pairs')
+        directions = union_all(
+            select([pairs.c.from_lang_id, pairs.c.to_lang_id, pairs.c.count]),
+            select([pairs.c.to_lang_id, pairs.c.from_lang_id, pairs.c.count]),
+        ).alias('directions')
+        session.execute(st.insert().from_select(
+            ('file_id', 'from_lang_id', 'to_lang_id', 'count'),
+            select([literal(file_id), directions.c.from_lang_id,
+                    directions.c.to_lang_id, func.sum(directions.c.count)]) \
+                .group_by(directions.c.from_lang_id, directions.c.to_lang_id)
+        ))
+        session.execute(s.delete().where(s.c.file_id == file_id))
+        if added or removed:
+            bump_generation(session)
+        logger.info('%s: %d definitions added, %d removed' % (
+            self._file.path, added, removed))
+
+        file = self._file
+        file.digest = digest
         file.mtime = _mtime(file.path)
         session.add(file)
         session.commit()
 
+WORD_COLUMNS = (
+    'lang_id', 'original', 'roman_transliteration',
+    'key', 'roman_key', 'key_reversed', 'roman_key_reversed',
+)
+# Staging columns for each side of a translation, after the prefix from_ or
+# to_
+SIDE_COLUMNS = WORD_COLUMNS[:2] + ('text',) + WORD_COLUMNS[2:]
+LOADER_COLUMNS = ('file_id', 'index', 'hash', 'part_of_speech_id') + \
+    tuple('from_' + column for column in SIDE_COLUMNS) + \
+    tuple('to_' + column for column in SIDE_COLUMNS)
+DICTIONARY_COLUMNS = (
+    'file_id', 'index', 'hash', 'part_of_speech_id',
+    'from_word_id', 'from_text', 'to_word_id', 'to_text',
+)
+
+def insert(session, table, columns, rows):
+    '''
+    Insert many rows (tuples in the order of columns) in one statement
+    '''
+    connection = session.connection()
+    if connection.dialect.name == 'postgresql':
+        buf = StringIO()
+        for row in rows:
+            buf.write('\t'.join(map(_copy_value, row)))
+            buf.write('\n')
+        buf.seek(0)
+        cursor = connection.connection.cursor()
+        cursor.copy_expert('COPY %s (%s) FROM STDIN' % (
+            table.name, ', '.join('"%s"' % c for c in columns)), buf)
+    else:
+        params = [dict(zip(columns, row)) for row in rows]
+        if params:
+            connection.execute(table.insert(), params)
+
+def _copy_value(x):
+    if x is None:
+        return '\\N'
+    else:
+        return str(x) \
+            .replace('\\', '\\\\') \
+            .replace('\t', '\\t') \
+            .replace('\n', '\\n') \
+            .replace('\r', '\\r')
+
 class table_dict(object):
-    def __init__(self, Model, key):
-        self._Model = Model
+    '''
+    Map the key column of a small lookup table to ids, creating rows for new
+    keys. All existing rows are read once, up front.
+    '''
+    def __init__(self, session, Model, key):
+        self._session = session
+        self._table = Model.__table__
         self._key = key
-        self._cache = {}
-    def __call__(self, session, text):
+        self._cache = dict(session.query(getattr(Model, key), Model.id))
+    def __call__(self, text):
         if text not in self._cache:
-            self._cache[text] = get_or_create(session, self._Model, **{self._key: text})
+            result = self._session.execute(self._table.insert(), {self._key: text})
+            self._cache[text] = result.inserted_primary_key[0]
         return self._cache[text]
 
+def lookup_tables(session):
+    '''
+    :returns: :py:class:`table_dict` of parts of speech and of languages
+    '''
+    return (table_dict(session, PartOfSpeech, 'text'),
+            table_dict(session, Language, 'code'))
+
 class PartOfSpeech(Base):
     __tablename__ = 'part_of_speech'
     id = Column(Integer, primary_key=True)
@@ -153,39 +575,214 @@ class Language(Base):
     length = column_property(func.length(code))
 Index('language_length', Language.length)
 
+class Word(Base):
+    '''
+    Words, each stored once for each language with its transliteration and
+    search keys, for the translations in :py:class:`Dictionary`
+    '''
+    __tablename__ = 'word'
+    __table_args__ = (UniqueConstraint('lang_id', 'original'),)
+    # The trigram index refers to rows by this id, so it must be stable.
+    id = Column(Integer, primary_key=True)
+    lang_id = Column(Integer, ForeignKey(Language.id), nullable=False)
+    lang = relationship(Language)
+    original = Column(String, nullable=False)
+    roman_transliteration = Column(String, nullable=True)
+    CheckConstraint('original != roman_transliteration')
+    # Search keys, from transliterate.fold, and the same reversed for
+    # suffix searches
+    key = Column(Key, nullable=False)
+    roman_key = Column(Key, nullable=True)
+    key_reversed = Column(Key, nullable=False)
+    roman_key_reversed = Column(Key, nullable=True)
+    def highlight(self, search):
+        return highlight(
+            self.lang.code,
+            self.original,
+            self.roman_transliteration or self.original,
+            search,
+        )
+
+Index('word_key', Word.key)
+Index('word_roman_key', Word.roman_key)
+Index('word_key_reversed', Word.key_reversed)
+Index('word_roman_key_reversed', Word.roman_key_reversed)
+
 class Dictionary(Base):
+    '''
+    Translations, each stored once with the sides in a fixed order. A
+    search finds them from either side, through :py:func:`oriented`.
+    '''
     __tablename__ = 'dictionary'
-    file_id = Column(Integer, ForeignKey(File.id), primary_key=True)
+    __table_args__ = (UniqueConstraint('file_id', 'hash'),)
+    id = Column(Integer, primary_key=True)
+    file_id = Column(Integer, ForeignKey(File.id), nullable=False)
     file = relationship(File,
         backref=backref('definitions',
             cascade='save-update, merge, delete, delete-orphan'))
-    index = Column(Integer, primary_key=True)
+    index = Column(Integer, nullable=False)
+    hash = Column(BigInteger, nullable=False)
 
     part_of_speech_id = Column(Integer, ForeignKey(PartOfSpeech.id), nullable=False)
     part_of_speech = relationship(PartOfSpeech)
 
-    from_lang_id = Column(Integer, ForeignKey(Language.id), nullable=False)
-    from_lang = relationship(Language, foreign_keys=[from_lang_id])
+    # The words as they are looked up, and as they are written in full if
+    # that is different, for when they are the translation
+    from_word_id = Column(Integer, ForeignKey(Word.id), nullable=False)
+    from_word = relationship(Word, foreign_keys=[from_word_id])
+    from_text = Column(String, nullable=True)
+    to_word_id = Column(Integer, ForeignKey(Word.id), nullable=False)
+    to_word = relationship(Word, foreign_keys=[to_word_id])
+    to_text = Column(String, nullable=True)
+
+Index('from_word', Dictionary.from_word_id)
+Index('to_word', Dictionary.to_word_id)
+
+def oriented(where, to_langs=()):
+    '''
+    Definitions with a row for each direction of each translation that is
+    wanted, as a UNION ALL of the translations read from the side as it is
+    stored and from the other side. Its columns are those used for
+    searching: id, part_of_speech_id, from_lang_id, from_original,
+    from_roman_transliteration, from_length, to_lang_id, to_word and
+    to_length.
+
+    The words are found first, and then their translations, so that each
+    word is checked once however many translations it has.
 
-    # TODO: Allow for queries in both roman and original
+    :param where: Function from an alias of :py:class:`Word` to the
+        condition on it for the words to look up
+    :param to_langs: Codes of the languages of the translations, or
+        nothing for all
+    '''
+    d = Dictionary.__table__
+    words = Word.__table__.alias('looked_up')
+    selects = []
+    for near_name, far_name in (('from', 'to'), ('to', 'from')):
+        near = Word.__table__.alias('near')
+        far = Word.__table__.alias('far')
+        to_word = func.coalesce(d.c[far_name + '_text'], far.c.original)
+        condition = near.c.id.in_(select([words.c.id]).where(where(words)))
+        if to_langs:
+            condition = and_(condition, far.c.lang_id.in_(
+                select([Language.id]).where(Language.code.in_(to_langs))))
+        selects.append(select([
+            d.c.id,
+            d.c.part_of_speech_id,
+            near.c.lang_id.label('from_lang_id'),
+            near.c.original.label('from_original'),
+            near.c.roman_transliteration.label('from_roman_transliteration'),
+            func.length(near.c.original).label('from_length'),
+            far.c.lang_id.label('to_lang_id'),
+            to_word.label('to_word'),
+            func.length(to_word).label('to_length'),
+        ]).select_from(d \
+            .join(near, near.c.id == d.c[near_name + '_word_id']) \
+            .join(far, far.c.id == d.c[far_name + '_word_id'])
+        ).where(condition))
+    return union_all(*selects).alias('oriented')
+
+class Statistic(Base):
+    '''
+    Number of definitions for each pair of languages in each file, kept up
+    to date by :py:class:`Loader` so that listing and checking languages
+    need not read the dictionary table
+    '''
+    __tablename__ = 'statistic'
+    file_id = Column(Integer, ForeignKey(File.id), primary_key=True)
+    from_lang_id = Column(Integer, ForeignKey(Language.id), primary_key=True)
+    to_lang_id = Column(Integer, ForeignKey(Language.id), primary_key=True)
+    count = whole_number('count')
+
+class Staging(Base):
+    '''
+    Definitions being read from a file, before :py:class:`Loader` compares
+    them with the ones in :py:class:`Dictionary`
+    '''
+    __tablename__ = 'staging'
+    file_id = Column(Integer, primary_key=True)
+    index = Column(Integer, primary_key=True)
+    hash = Column(BigInteger, nullable=False)
+    part_of_speech_id = Column(Integer, nullable=False)
+    from_lang_id = Column(Integer, nullable=False)
     from_original = Column(String, nullable=False)
-    from_word = synonym('from_original')
+    from_text = Column(String, nullable=True)
     from_roman_transliteration = Column(String, nullable=True)
-    CheckConstraint('from_word != from_roman_transliteration')
-    from_roman = column_property(func.coalesce(from_roman_transliteration, from_original))
-    from_length = column_property(func.length(from_original))
-    def from_highlight(self, search):
-        return highlight(
-            self.from_lang.code,
-            self.from_original,
-            self.from_roman_transliteration or self.from_original,
-            search,
-        )
+    from_key = Column(String, nullable=False)
+    from_roman_key = Column(String, nullable=True)
+    from_key_reversed = Column(String, nullable=False)
+    from_roman_key_reversed = Column(String, nullable=True)
+    to_lang_id = Column(Integer, nullable=False)
+    to_original = Column(String, nullable=False)
+    to_text = Column(String, nullable=True)
+    to_roman_transliteration = Column(String, nullable=True)
+    to_key = Column(String, nullable=False)
+    to_roman_key = Column(String, nullable=True)
+    to_key_reversed = Column(String, nullable=False)
+    to_roman_key_reversed = Column(String, nullable=True)
+Index('staging_hash', Staging.file_id, Staging.hash)
+
+# Substring index over the search keys of the words, so that search need
+# not scan the whole word table. SQLite uses an external-content FTS5 table
+# with the trigram tokenizer, kept in sync with triggers; PostgreSQL uses
+# pg_trgm.
+TRIGRAM = table('word_trigram', column('rowid'), column('word_trigram'))
+TRIGRAM_VOCAB = table('word_trigram_vocab', column('term'), column('doc'))
+TRIGRAM_MINIMUM = 3
+# Trigram tables of earlier versions, which indexed the dictionary table
+OLD_TRIGRAM_TABLES = ('dictionary_trigram_vocab', 'dictionary_trigram')
+TRIGRAM_DDL = {
+    'sqlite': (
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS word_trigram USING fts5(
+            key, roman_key, content='word', content_rowid='id',
+            tokenize='trigram case_sensitive 1')''',
+        '''CREATE TRIGGER IF NOT EXISTS word_trigram_insert AFTER INSERT ON word BEGIN
+            INSERT INTO word_trigram
+                (rowid, key, roman_key)
+            VALUES (new.id, new.key, new.roman_key);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS word_trigram_delete AFTER DELETE ON word BEGIN
+            INSERT INTO word_trigram
+                (word_trigram, rowid, key, roman_key)
+            VALUES ('delete', old.id, old.key, old.roman_key);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS word_trigram_update AFTER UPDATE ON word BEGIN
+            INSERT INTO word_trigram
+                (word_trigram, rowid, key, roman_key)
+            VALUES ('delete', old.id, old.key, old.roman_key);
+            INSERT INTO word_trigram
+                (rowid, key, roman_key)
+            VALUES (new.id, new.key, new.roman_key);
+        END''',
+        # Number of words with each trigram, for estimating result counts
+        "CREATE VIRTUAL TABLE IF NOT EXISTS word_trigram_vocab USING fts5vocab(word_trigram, 'row')",
+        "INSERT INTO word_trigram (word_trigram) VALUES ('rebuild')",
+    ),
+    'postgresql': (
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        '''CREATE INDEX IF NOT EXISTS word_key_trigram
+            ON word USING gin (key gin_trgm_ops)''',
+        '''CREATE INDEX IF NOT EXISTS word_roman_key_trigram
+            ON word USING gin (roman_key gin_trgm_ops)''',
+    ),
+}
 
-    to_lang_id = Column(Integer, ForeignKey(Language.id), nullable=False)
-    to_lang = relationship(Language, foreign_keys=[to_lang_id])
-    to_word = Column(String, nullable=False)
-    to_length = column_property(func.length(to_word))
+def create_trigram_index(engine):
+    statements = TRIGRAM_DDL.get(engine.dialect.name, ())
+    try:
+        with engine.begin() as connection:
+            if engine.dialect.name == 'sqlite' and \
+                    engine.dialect.has_table(connection, TRIGRAM_VOCAB.name):
+                return
+            for statement in statements:
+                connection.execute(statement)
+    except (OperationalError, ProgrammingError) as e:
+        logger.warning('Could not create the trigram index: %s' % e)
 
-Index('from_length', Dictionary.from_length)
-Index('to_length', Dictionary.to_length)
+def has_trigram_index(session):
+    '''
+    Whether search can use an FTS5 trigram table (SQLite only; on PostgreSQL
+    the pg_trgm indices serve the ordinary LIKE query)
+    '''
+    return session.bind.dialect.name == 'sqlite' and \
+        session.bind.dialect.has_table(session.connection(), TRIGRAM.name)
@@ -0,0 +1,422 @@
+# vortaro
+# Copyright (C) 2017, 2018 Thomas Levine
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+Native search file: the words and definitions of a database written out
+as arrays in one file, with a suffix array over the search keys, so that
+searches can memory-map it and run without a database.
+
+The file starts with a header giving the generation of the database that
+it was written from and where each section is. The sections are arrays of
+unsigned 32-bit integers in the byte order of the machine, except for two
+byte strings:
+
+pool
+    UTF-8 text of the words, translations, languages and parts of speech,
+    which the other sections refer to by offset and length
+text
+    Each distinct search key (key or roman_key of a word) in UTF-8, each
+    preceded by a separator byte, with one more at the end. The separator,
+    0xff, does not occur in UTF-8, so a match cannot span two keys.
+key_starts
+    Offset in the text of the separator before each key, and of the last
+    separator
+suffixes
+    Offsets of the suffixes of the text that start a character, sorted by
+    their bytes, so that the suffixes that start with some bytes are a
+    range of them. Searching for the search key finds the keys that
+    contain it; with a separator before it, the keys that start with it;
+    and with one after it, the keys that end with it.
+key_word_offsets, key_words
+    The words that have each key, as a compressed sparse row: the words of
+    key k are key_words[key_word_offsets[k]:key_word_offsets[k + 1]].
+words
+    Five integers for each word: the id of its language and the offsets and
+    lengths of its original and its transliteration in the pool
+word_definition_offsets, word_definitions
+    The definitions of each word, likewise, as twice the index of the
+    definition, plus one if the word is on its to-side
+definitions
+    Seven integers for each definition: the id of its part of speech, then
+    for each side the index of the word and the offset and length of its
+    text in the pool
+languages, parts_of_speech
+    Offset and length in the pool of the code of the language or the text
+    of the part of speech with each id
+
+A missing string has the offset :py:data:`NONE`.
+'''
+
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_right
+from logging import getLogger
+from threading import Lock
+
+from sqlalchemy.sql import and_, func, select, union_all
+
+from .models import generation, Dictionary, Language, PartOfSpeech, Word
+from .formats import PART
+from .transliterate import fold
+
+logger = getLogger(__name__)
+
+FILENAME = 'vortaro.native'
+MAGIC = b'vortaro\0'
+VERSION = 1
+BYTE_ORDER = 0x01020304
+SEPARATOR = b'\xff'
+NONE = 0xffffffff
+SECTIONS = (
+    'pool', 'text', 'key_starts', 'suffixes', 'key_word_offsets', 'key_words',
+    'words', 'word_definition_offsets', 'word_definitions', 'definitions',
+    'languages', 'parts_of_speech',
+)
+HEADER = struct.Struct('=8sII32s' + 'QQ' * len(SECTIONS))
+WORD = 5
+DEFINITION = 7
+ALIGNMENT = 8
+
+# Fields of the rows that searches yield
+FIELDS = ('part_of_speech', 'from_lang', 'from_word', 'from_roman', 'to_lang', 'to_word')
+
+def write(session, path):
+    '''
+    Write the native search file for the definitions in a database, unless
+    the file is already up to date. It is written beside the path and then
+    moved into place, so searches that have the old file open keep reading
+    the old file.
+
+    :param pathlib.Path path: Native search file
+    :returns: Whether the file was written
+    '''
+    current = generation(session).encode('ascii')
+    if path.exists() and _generation(path) == current:
+        return False
+    logger.info('Writing %s' % path)
+
+    pool = bytearray()
+    def add(text, record):
+        if text is None:
+            record.extend((NONE, 0))
+        else:
+            encoded = text.encode('utf-8')
+            record.extend((len(pool), len(encoded)))
+            pool.extend(encoded)
+
+    sections = {}
+    for name, model, column in (
+            ('languages', Language, Language.code),
+            ('parts_of_speech', PartOfSpeech, PartOfSpeech.text)):
+        rows = session.query(model.id, column).order_by(model.id).all()
+        record = array('I', (NONE, 0)) * ((rows[-1][0] + 1) if rows else 0)
+        for id, text in rows:
+            encoded = array('I')
+            add(text, encoded)
+            record[2*id:2*id+2] = encoded
+        sections[name] = record
+
+    # Words are numbered in order of id.
+    w = Word.__table__
+    top = session.execute(select([func.max(w.c.id)])).scalar() or 0
+    index_of = array('I', (NONE,)) * (top + 1)
+    words = array('I')
+    for id, lang_id, original, roman in session.execute(
+            select([w.c.id, w.c.lang_id, w.c.original, w.c.roman_transliteration]) \
+            .order_by(w.c.id)):
+        index_of[id] = len(words) // WORD
+        words.append(lang_id)
+        add(original, words)
+        add(roman, words)
+    sections['words'] = words
+
+    text = bytearray()
+    key_starts = array('I')
+    key_word_offsets = array('I')
+    key_words = array('I')
+    keys = union_all(
+        select([w.c.key.label('key'), w.c.id]),
+        select([w.c.roman_key, w.c.id]).where(and_(
+            w.c.roman_key.isnot(None), w.c.roman_key != w.c.key)),
+    ).alias('keys')
+    previous = None
+    for key, id in session.execute(
+            select([keys.c.key, keys.c.id]).order_by(keys.c.key, keys.c.id)):
+        if key != previous:
+            key_starts.append(len(text))
+            key_word_offsets.append(len(key_words))
+            text.extend(SEPARATOR)
+            text.extend(key.encode('utf-8'))
+            previous = key
+        key_words.append(index_of[id])
+    key_starts.append(len(text))
+    key_word_offsets.append(len(key_words))
+    text.extend(SEPARATOR)
+    text = bytes(text)
+    sections.update(text=text, key_starts=key_starts,
+                    key_word_offsets=key_word_offsets, key_words=key_words)
+
+    d = Dictionary.__table__
+    definitions = array('I')
+    counts = array('I', (0,)) * (len(words) // WORD)
+    for pos_id, from_word_id, from_text, to_word_id, to_text in session.execute(
+            select([d.c.part_of_speech_id, d.c.from_word_id, d.c.from_text,
+                    d.c.to_word_id, d.c.to_text]).order_by(d.c.id)):
+        from_word = index_of[from_word_id]
+        to_word = index_of[to_word_id]
+        definitions.extend((pos_id, from_word))
+        add(from_text, definitions)
+        definitions.append(to_word)
+        add(to_text, definitions)
+        counts[from_word] += 1
+        counts[to_word] += 1
+    sections['definitions'] = definitions
+
+    # Sort the definitions by word, counting first and then placing them.
+    offsets = array('I', (0,))
+    for count in counts:
+        offsets.append(offsets[-1] + count)
+    places = array('I', offsets[:-1])
+    word_definitions = array('I', (0,)) * offsets[-1]
+    for i in range(len(definitions) // DEFINITION):
+        for side, column in enumerate((1, 4)):
+            word = definitions[DEFINITION*i + column]
+            word_definitions[places[word]] = 2*i + side
+            places[word] += 1
+    sections.update(word_definition_offsets=offsets,
+                    word_definitions=word_definitions)
+
+    sections['suffixes'] = _suffixes(text)
+    sections['pool'] = pool
+
+    part = path.with_name(path.name + PART)
+    with part.open('wb') as fp:
+        fp.write(bytes(HEADER.size))
+        layout = []
+        for name in SECTIONS:
+            fp.write(bytes(-fp.tell() % ALIGNMENT))
+            offset = fp.tell()
+            section = sections[name]
+            if isinstance(section, array):
+                section.tofile(fp)
+            else:
+                fp.write(section)
+            layout.extend((offset, fp.tell() - offset))
+        fp.seek(0)
+        fp.write(HEADER.pack(MAGIC, VERSION, BYTE_ORDER, current, *layout))
+    os.replace(str(part), str(path))
+    return True
+
+def _suffixes(text):
+    '''
+    Sort the suffixes of text that start a character, other than the last
+    separator, one first byte at a time so that only the suffixes with
+    that byte are held as strings. Each is compared up to the end of its
+    key, as no search goes further.
+
+    :param bytes text: Keys, each preceded by a separator, and a separator
+    :rtype: array.array
+    '''
+    buckets = [array('I') for _ in range(256)]
+    for position, byte in enumerate(text[:-1]):
+        # UTF-8 continuation bytes are 0x80 to 0xbf.
+        if not 0x80 <= byte < 0xc0:
+            buckets[byte].append(position)
+    find = text.find
+    def suffix(position):
+        return text[position:find(SEPARATOR, position + 1) + 1]
+    suffixes = array('I')
+    for bucket in buckets:
+        suffixes.extend(sorted(bucket, key=suffix))
+    return suffixes
+
+def _generation(path):
+    with path.open('rb') as fp:
+        header = fp.read(HEADER.size)
+    if len(header) == HEADER.size:
+        magic, version, order, current = HEADER.unpack(header)[:4]
+        if (magic, version, order) == (MAGIC, VERSION, BYTE_ORDER):
+            return current.rstrip(b'\0')
+
+class NativeIndex(object):
+    '''
+    A native search file, memory-mapped; opening it reads only the header
+    and the small tables of languages and parts of speech. It can be
+    shared between threads. Its generation attribute is the generation of
+    the database that it was written from.
+
+    :param pathlib.Path path: Native search file
+    '''
+    def __init__(self, path):
+        with path.open('rb') as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        header = HEADER.unpack_from(self._mmap) \
+            if len(self._mmap) >= HEADER.size else (None,) * 4
+        if tuple(header[:3]) != (MAGIC, VERSION, BYTE_ORDER):
+            raise ValueError('%s is not a native search file of this version; '
+                             'index with the native engine to write it again' % path)
+        self.generation = header[3].rstrip(b'\0').decode('ascii')
+        view = memoryview(self._mmap)
+        places = dict(zip(SECTIONS, zip(header[4::2], header[5::2])))
+        self._pool = places['pool'][0]
+        self._text = places['text'][0]
+        for name in SECTIONS[2:]:
+            offset, size = places[name]
+            setattr(self, '_' + name, view[offset:offset+size].cast('I'))
+        self._language_codes = self._table(self._languages)
+        self._language_ids = {code: id for id, code in self._language_codes.items()}
+        self._parts_of_speech_texts = self._table(self._parts_of_speech)
+
+    def search(self, text, from_langs=(), to_langs=(), match='contains'):
+        '''
+        Find the definitions that match a search, each translation found
+        from either of its sides and turned to read from that side, as
+        :py:func:`vortaro.models.oriented` does, in no particular order
+
+        :param text: The word/fragment to search for
+        :param from_langs: Codes of the languages of the words, or nothing
+            for all
+        :param to_langs: Codes of the languages of the translations, or
+            nothing for all
+        :param match: 'contains', 'exact', 'prefix' or 'suffix'
+        :returns: Tuples of :py:data:`FIELDS`
+        '''
+        key = fold(text).encode('utf-8')
+        pattern = {
+            'contains': key,
+            'exact': SEPARATOR + key + SEPARATOR,
+            'prefix': SEPARATOR + key,
+            'suffix': key + SEPARATOR,
+        }[match]
+        start, end = self._range(pattern)
+        key_starts = self._key_starts
+        keys = {bisect_right(key_starts, position) - 1
+                for position in self._suffixes[start:end]}
+
+        offsets = self._key_word_offsets
+        found = set()
+        for k in keys:
+            found.update(self._key_words[offsets[k]:offsets[k+1]])
+        words = self._words
+        if from_langs:
+            from_ids = self.language_ids(from_langs)
+            found = [word for word in found if words[WORD*word] in from_ids]
+        to_ids = self.language_ids(to_langs) if to_langs else None
+
+        languages = self._language_codes
+        parts_of_speech = self._parts_of_speech_texts
+        definitions = self._definitions
+        offsets = self._word_definition_offsets
+        cache = {}
+        for near in found:
+            for entry in self._word_definitions[offsets[near]:offsets[near+1]]:
+                i, side = divmod(entry, 2)
+                record = definitions[DEFINITION*i:DEFINITION*(i+1)]
+                far = record[4 - 3*side]
+                if to_ids is not None and words[WORD*far] not in to_ids:
+                    continue
+                near_lang, near_original, near_roman = self._word(near, cache)
+                far_lang, far_original, _ = self._word(far, cache)
+                far_text = self._string(*record[5 - 3*side:7 - 3*side])
+                yield (
+                    parts_of_speech[record[0]],
+                    languages[near_lang],
+                    near_original,
+                    near_roman,
+                    languages[far_lang],
+                    far_original if far_text is None else far_text,
+                )
+
+    def languages(self):
+        '''
+        Codes of the languages that have words
+        '''
+        return frozenset(self._language_ids)
+
+    def language_ids(self, codes):
+        return {self._language_ids[code] for code in codes
+                if code in self._language_ids}
+
+    def _range(self, pattern):
+        '''
+        Range of :py:data:`suffixes` that start with the pattern
+        '''
+        mm = self._mmap
+        suffixes = self._suffixes
+        base = self._text
+        n = len(pattern)
+        low, high = 0, len(suffixes)
+        while low < high:
+            middle = (low + high) // 2
+            position = base + suffixes[middle]
+            if mm[position:position+n] < pattern:
+                low = middle + 1
+            else:
+                high = middle
+        start, high = low, len(suffixes)
+        while low < high:
+            middle = (low + high) // 2
+            position = base + suffixes[middle]
+            if mm[position:position+n] <= pattern:
+                low = middle + 1
+            else:
+                high = middle
+        return start, low
+
+    def _word(self, word, cache):
+        try:
+            return cache[word]
+        except KeyError:
+            record = self._words[WORD*word:WORD*(word+1)]
+            cache[word] = value = (record[0], self._string(*record[1:3]),
+                                   self._string(*record[3:5]))
+            return value
+
+    def _string(self, offset, length):
+        if offset == NONE:
+            return None
+        position = self._pool + offset
+        return self._mmap[position:position+length].decode('utf-8')
+
+    def _table(self, section):
+        '''
+        Strings of a section of (offset, length) pairs by id
+        '''
+        return {id: self._string(section[2*id], section[2*id+1])
+                for id in range(len(section) // 2) if section[2*id] != NONE}
+
+_indexes = {}
+_indexes_lock = Lock()
+def load(path):
+    '''
+    Open a native search file, or reuse the one that is open if the file
+    has not been replaced since
+
+    :param pathlib.Path path: Native search file
+    :rtype: NativeIndex
+    '''
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        raise FileNotFoundError('%s does not exist; index with the native '
+                                'engine to write it' % path)
+    signature = stat.st_ino, stat.st_mtime_ns, stat.st_size
+    with _indexes_lock:
+        if path not in _indexes or _indexes[path][0] != signature:
+            _indexes[path] = signature, NativeIndex(path)
+        return _indexes[path][1]
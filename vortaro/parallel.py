@@ -0,0 +1,108 @@
+# vortaro
+# Copyright (C) 2017, 2018 Thomas Levine
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+Index several files at once. Worker processes parse and transliterate the
+files, and they send batches of rows over a bounded queue to this process,
+which is the only one that writes to the database.
+'''
+
+import multiprocessing
+from logging import getLogger
+from pathlib import Path
+from queue import Empty
+from traceback import format_exc
+
+from .models import Loader, lookup_tables, prepare, chunks, _digest
+from .formats import FORMATS
+
+logger = getLogger(__name__)
+
+ROWS, DONE, UNCHANGED, ERROR, STARTED = range(5)
+TIMEOUT = 1
+
+def update(session, files, chunksize, jobs, refresh=False):
+    '''
+    :param session: Database session, used only in this process
+    :param files: :py:class:`vortaro.models.File` objects to update
+    :param int chunksize: Number of definitions per batch
+    :param int jobs: Number of worker processes
+    :param bool refresh: Read files even if their contents have not changed
+    '''
+    files = {file.id: file for file in files}
+    tasks = [(file.id, file.format.name, file.path,
+              None if refresh else file.digest, chunksize)
+             for file in files.values()]
+    queue = multiprocessing.Queue(2 * jobs)
+    # One pair for all of the loaders, whose batches are interleaved
+    lookups = lookup_tables(session)
+    loaders = {}
+    remaining = len(files)
+    started = 0
+    with multiprocessing.Pool(jobs, _initialize, (queue,)) as pool:
+        result = pool.map_async(_parse, tasks)
+        while remaining:
+            try:
+                file_id, message, body = queue.get(timeout=TIMEOUT)
+            except Empty:
+                if result.ready():
+                    result.get()
+                    raise RuntimeError('The worker processes stopped before '
+                                       'reading every file')
+                continue
+            if message == STARTED:
+                # The pool replaces a worker that dies, and its file is lost.
+                started += 1
+                if started > jobs:
+                    raise RuntimeError('A worker process stopped unexpectedly')
+                continue
+            elif message == ERROR:
+                raise RuntimeError('Could not read %s:\n%s' % (
+                    files[file_id].path, body))
+            elif message == UNCHANGED:
+                files[file_id].unchanged(session)
+            else:
+                if file_id not in loaders:
+                    loaders[file_id] = Loader(session, files[file_id], lookups)
+                if message == ROWS:
+                    loaders[file_id](body)
+                    continue
+                loaders.pop(file_id).close(body)
+            remaining -= 1
+            logger.info('Indexed %s\n' % files[file_id].path)
+        result.get()
+
+_queue = None
+def _initialize(queue):
+    global _queue
+    _queue = queue
+    _queue.put((None, STARTED, None))
+
+def _parse(task):
+    file_id, format_name, path, digest, chunksize = task
+    try:
+        path = Path(path)
+        new_digest = _digest(path)
+        if new_digest == digest:
+            _queue.put((file_id, UNCHANGED, None))
+            return
+        read = FORMATS[format_name].read
+        for rows in chunks(prepare(read, path), chunksize):
+            _queue.put((file_id, ROWS, rows))
+    except Exception:
+        _queue.put((file_id, ERROR, format_exc()))
+    else:
+        _queue.put((file_id, DONE, new_digest))
@@ -0,0 +1,66 @@
+# vortaro
+# Copyright (C) 2017, 2018 Thomas Levine
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from os import environ
+
+import pytest
+
+from .. import index, ui
+from ..cache import Cache
+
+DICTCC = '''\
+# EN-RU vocabulary database\tcompiled by dict.cc
+
+elephant\tслон\tnoun
+baby elephant\tслонёнок\tnoun
+mineral water\tминеральная вода\tnoun
+water\tвода\tnoun
+street\tУлица\tnoun
+'''
+ESPDIC = '''\
+ESPDIC
+elefanto : elephant
+ĉu : whether, if
+akvo : water
+'''
+
+# Benchmarks that take a while run only when this is set.
+benchmark = pytest.mark.skipif(not environ.get('VORTARO_BENCHMARK'),
+                               reason='set VORTARO_BENCHMARK to run benchmarks')
+
+@pytest.fixture
+def data_dir(tmp_path):
+    for name, body in (('dict.cc', DICTCC), ('espdic', ESPDIC)):
+        directory = tmp_path / name
+        directory.mkdir()
+        with (directory / 'dictionary.txt').open('w') as fp:
+            fp.write(body)
+    return tmp_path
+
+@pytest.fixture
+def database(data_dir):
+    url = 'sqlite:///%s' % (data_dir / 'vortaro.sqlite')
+    index(data_dir=data_dir, database=url)
+    return url
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    # The cache of the default data directory, so that tests leave it alone
+    result = Cache(path=tmp_path / 'cache.sqlite')
+    _cache = ui._cache
+    monkeypatch.setattr(ui, '_cache', lambda data_dir:
+                        result if data_dir == ui.DATA else _cache(data_dir))
+    return result
@@ -0,0 +1,64 @@
+# vortaro
+# Copyright (C) 2017, 2018 Thomas Levine
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+
+from .. import index, search, ui
+from ..cache import Cache
+
+@pytest.mark.parametrize('disk', (False, True))
+def test_lru(tmp_path, disk):
+    cache = Cache(2, tmp_path / 'cache.sqlite' if disk else None)
+    cache.set(('a',), [1])
+    cache.set(('b',), [2])
+    assert cache.get(('a',)) == [1]
+    cache.set(('c',), [3])
+    assert cache.get(('b',)) is None
+    assert cache.get(('a',)) == [1]
+    assert cache.get(('c',)) == [3]
+    assert tuple(cache.info()) == (3, 1, 2, 2)
+    cache.clear()
+    assert tuple(cache.info()) == (0, 0, 2, 0)
+
+def test_search(data_dir, database):
+    cache = Cache()
+    assert list(search('pachy', database=database, cache=cache)) == []
+    assert list(search('PACHY', database=database, cache=cache)) == []
+    assert cache.info().hits == 1
+
+    path = data_dir / 'espdic' / 'dictionary.txt'
+    with path.open('a') as fp:
+        fp.write('elefanto : pachyderm\n')
+    index(data_dir=data_dir, database=database, refresh=True)
+    assert [r.to_word for r in search('pachy', database=database, cache=cache)] \
+        == ['elefanto']
+    assert cache.info().hits == 1
+
+def test_ui(database, cache):
+    first = list(ui.search('ele', 2, width=80, database=database))
+    second = list(ui.search('ele', 2, width=80, database=database))
+    assert first == second
+    assert tuple(cache.info())[:2] == (1, 1)
+    assert list(ui.history(database=database, nodeduplicate=True)) == \
+        [('ele',), ('ele',)]
+
+def test_ui_data_dir(database, cache, tmp_path):
+    data_dir = tmp_path / 'other'
+    for _ in range(2):
+        list(ui.search('ele', 2, width=80, database=database, data_dir=data_dir))
+    assert (data_dir / 'cache.sqlite').exists()
+    assert tuple(cache.info())[:2] == (0, 0)
+    assert list(ui.cache(data_dir=data_dir))[:2] == ['hits\t1', 'misses\t1']
@@ -47,6 +47,14 @@ HIGHLIGHT = (
         ('', 'чокањчиће', '')),
 #   ('sr', 'чокањчиће', 'čokanjčiće', 'jči',
 #       '\x1b[0m\x1b[0m\x1b[1mчокањчиће\x1b[0m\x1b[0m'),
+    ('ru', 'Улица', 'ulica', 'LIC',
+        ('У', 'лиц', 'а')),
+    ('ru', 'Улица', 'ulica', 'лиц',
+        ('У', 'лиц', 'а')),
+    ('bg', 'Щастие', 'štastie', 'št',
+        ('', 'Щ', 'астие')),
+    ('bg', 'Щастие', 'štastie', 'š',
+        ('', 'Щастие', '')),
 )
 
 @pytest.mark.parametrize('lang, big_foreign, big_roman, small_roman, highlighted', HIGHLIGHT)
@@ -0,0 +1,176 @@
+# vortaro
+# Copyright (C) 2017, 2018 Thomas Levine
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from .. import index, parallel, search, languages, Vortaro
+from ..models import prepare, SchemaError, SCHEMA
+
+def _definitions(url):
+    engine = create_engine(url)
+    return dict(engine.execute(
+        "SELECT CASE WHEN f.original = 'elefanto' THEN t.original "
+        'ELSE f.original END, dictionary.id FROM dictionary '
+        'JOIN word AS f ON f.id = from_word_id JOIN word AS t ON t.id = to_word_id '
+        "WHERE 'elefanto' IN (f.original, t.original)").fetchall())
+
+def _touch(path, seconds):
+    mtime = path.stat().st_mtime + seconds
+    os.utime(str(path), (mtime, mtime))
+
+def test_incremental(data_dir, database):
+    path = data_dir / 'espdic' / 'dictionary.txt'
+    before = _definitions(database)
+    with path.open('a') as fp:
+        fp.write('elefanto : pachyderm\n')
+    _touch(path, 10)
+    index(data_dir=data_dir, database=database)
+
+    after = _definitions(database)
+    assert set(after) == {'elephant', 'pachyderm'}
+    assert after['elephant'] == before['elephant']
+    assert {'elefanto'} == {r.to_word for r in search('pachy', database=database)}
+
+    with path.open('w') as fp:
+        fp.write('ESPDIC\nelefanto : pachyderm\n')
+    _touch(path, 20)
+    index(data_dir=data_dir, database=database)
+    assert set(_definitions(database)) == {'pachyderm'}
+    assert () == tuple(search('akvo', database=database))
+    assert 'en\teo\t1' in languages(database, pairs=True)
+
+def test_unchanged(data_dir, database):
+    path = data_dir / 'espdic' / 'dictionary.txt'
+    before = _definitions(database)
+    _touch(path, 10)
+    index(data_dir=data_dir, database=database, jobs=2)
+    assert _definitions(database) == before
+
+def _dictcc_files(data_dir, n):
+    directory = data_dir / 'dict.cc'
+    directory.mkdir()
+    for i in range(n):
+        with (directory / ('dictionary%d.txt' % i)).open('w') as fp:
+            fp.write('# DE-EN vocabulary database\tcompiled by dict.cc\n\n')
+            for j in range(2000):
+                fp.write('wort%d\tword%d\tpos%d\n' % (j, j, j // 50))
+
+def test_parallel_fresh(tmp_path):
+    _dictcc_files(tmp_path, 2)
+    database = 'sqlite:///%s' % (tmp_path / 'vortaro.sqlite')
+    index(data_dir=tmp_path, database=database, jobs=2, chunksize=10)
+    assert 'de\ten\t4000' in languages(database, pairs=True)
+
+def _die(task):
+    os._exit(1)
+
+def test_parallel_worker_dies(monkeypatch, tmp_path):
+    _dictcc_files(tmp_path, 1)
+    monkeypatch.setattr(parallel, '_parse', _die)
+    database = 'sqlite:///%s' % (tmp_path / 'vortaro.sqlite')
+    with pytest.raises(RuntimeError):
+        index(data_dir=tmp_path, database=database, jobs=2)
+
+def test_refresh(data_dir, database):
+    before = _definitions(database)
+    index(data_dir=data_dir, database=database, refresh=True)
+    assert _definitions(database) == before
+
+def test_partial_download(data_dir, database):
+    before = _definitions(database)
+    with (data_dir / 'espdic' / 'espdic.txt.part').open('w') as fp:
+        fp.write('ESPDIC\nelefanto : pachy')
+    index(data_dir=data_dir, database=database)
+    assert _definitions(database) == before
+
+def _set_schema(url, version):
+    create_engine(url).execute(
+        "UPDATE meta SET value = ? WHERE key = 'schema'", str(version))
+
+def test_older_schema(data_dir, database):
+    before = _definitions(database)
+    _set_schema(database, SCHEMA - 1)
+    with pytest.raises(SchemaError):
+        list(Vortaro(database).search('ele'))
+    with pytest.raises(SchemaError):
+        list(Vortaro(database).languages())
+    assert _definitions(database) == before
+    Vortaro(database).index(data_dir=data_dir)
+    assert set(_definitions(database)) == set(before)
+
+def test_newer_schema(data_dir, database):
+    before = _definitions(database)
+    _set_schema(database, SCHEMA + 1)
+    with pytest.raises(SchemaError):
+        list(Vortaro(database).search('ele'))
+    with pytest.raises(SchemaError):
+        Vortaro(database).index(data_dir=data_dir)
+    assert _definitions(database) == before
+
+def test_languages(database):
+    assert list(languages(database)) == ['en', 'eo', 'ru']
+    assert list(languages(database, pairs=True)) == [
+        'en\teo\t4', 'en\tru\t5', 'eo\ten\t4', 'ru\ten\t5',
+    ]
+
+def test_profiles(database):
+    client = Vortaro(database)
+    with client.session('index') as session:
+        assert session.execute('PRAGMA journal_mode').scalar() == 'wal'
+        assert session.execute('PRAGMA synchronous').scalar() == 0
+    with client.session('serve') as session:
+        assert session.execute('PRAGMA query_only').scalar() == 1
+        with pytest.raises(OperationalError):
+            session.execute('DELETE FROM history')
+
+def test_search_while_writing(database):
+    writer = sqlite3.connect(database[len('sqlite:///'):], isolation_level=None)
+    writer.execute('BEGIN EXCLUSIVE')
+    writer.execute('DELETE FROM dictionary')
+    try:
+        results = Vortaro(database).search('elephant', cache=None)
+        assert {r.to_word for r in results} == {'elefanto', 'слон', 'слонёнок'}
+    finally:
+        writer.execute('ROLLBACK')
+        writer.close()
+
+def test_one_row_per_translation(database):
+    engine = create_engine(database)
+    # Five dict.cc lines and four ESPDIC translations
+    assert engine.execute('SELECT count(*) FROM dictionary').scalar() == 9
+    assert {(r.from_lang, r.to_word) for r in search('слон', database=database)} == \
+        {('ru', 'elephant'), ('ru', 'baby elephant')}
+    assert {(r.from_lang, r.to_word) for r in search('elephant', database=database)} == \
+        {('en', 'elefanto'), ('en', 'слон'), ('en', 'слонёнок')}
+
+def test_one_row_per_word(database):
+    engine = create_engine(database)
+    # In dict.cc and in ESPDIC
+    assert engine.execute(
+        "SELECT count(*) FROM word WHERE original = 'elephant'").scalar() == 1
+
+def test_both_ways_stored_once():
+    def read(path):
+        yield ('', 'eo', 'akvo', None, 'en', 'water', None)
+        yield ('', 'en', 'water', None, 'eo', 'akvo', None)
+        yield ('', 'en', 'water', 'water (n)', 'eo', 'akvo', None)
+    hashes = [row[0] for row in prepare(read, None)]
+    assert hashes[0] == hashes[1] != hashes[2]
@@ -0,0 +1,118 @@
+# vortaro
+# Copyright (C) 2017, 2018 Thomas Levine
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import random
+import time
+
+import pytest
+
+from .. import index, native, ui, Vortaro, MATCHES
+from ..models import bump_generation
+from .conftest import benchmark
+from .test_search import QUERIES
+
+@pytest.fixture
+def database(data_dir):
+    url = 'sqlite:///%s' % (data_dir / 'vortaro.sqlite')
+    index(data_dir=data_dir, database=url, engine='native')
+    return url
+
+LANGUAGES = ((), ()), (('en',), ()), ((), ('ru',)), (('eo', 'ru'), ('en',))
+
+@pytest.mark.parametrize('text', [text for text, _ in QUERIES] + ['', 'o', 'elephant'])
+def test_search(data_dir, database, text):
+    client = Vortaro(database)
+    for match in MATCHES:
+        for from_langs, to_langs in LANGUAGES:
+            kwargs = dict(match=match, from_langs=from_langs, to_langs=to_langs)
+            assert list(client.search(text, engine='native', data_dir=data_dir,
+                                      **kwargs)) == \
+                list(client.search(text, cache=None, **kwargs))
+
+@pytest.mark.parametrize('limit', (0, 2))
+def test_ui(data_dir, database, limit):
+    sql = list(ui.search('ele', limit, width=80, database=database, nocache=True))
+    assert sql
+    assert list(ui.search('ele', limit, width=80, database=database,
+                          engine='native', data_dir=data_dir)) == sql
+
+def test_up_to_date(data_dir, database):
+    path = data_dir / native.FILENAME
+    with Vortaro(database).session() as session:
+        assert not native.write(session, path)
+    with (data_dir / 'espdic' / 'dictionary.txt').open('a') as fp:
+        fp.write('muso : mouse\n')
+    index(data_dir=data_dir, database=database, refresh=True)
+    assert [r.to_word for r in Vortaro(database).search(
+        'mus', engine='native', data_dir=data_dir)] == ['mouse']
+
+def test_out_of_date(caplog, data_dir, database):
+    client = Vortaro(database)
+    assert list(client.search('ele', engine='native', data_dir=data_dir))
+    assert 'out of date' not in caplog.text
+    with client.session() as session:
+        bump_generation(session)
+        session.commit()
+    assert list(client.search('ele', engine='native', data_dir=data_dir))
+    assert 'out of date' in caplog.text
+
+def test_missing(data_dir, database):
+    (data_dir / native.FILENAME).unlink()
+    with pytest.raises(FileNotFoundError):
+        list(Vortaro(database).search('ele', engine='native', data_dir=data_dir))
+
+def _words(n, seed):
+    r = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyzäöü'
+    for _ in range(n):
+        yield ''.join(r.choice(letters) for _ in range(r.randint(3, 12)))
+
+@benchmark
+def test_benchmark(tmp_path):
+    '''
+    Searches with the native engine and with SQLite, taking the best of
+    three runs; run pytest with -s and VORTARO_BENCHMARK set to see the
+    timings.
+    '''
+    n = 5000
+    directory = tmp_path / 'dict.cc'
+    directory.mkdir()
+    with (directory / 'dictionary.txt').open('w') as fp:
+        fp.write('# DE-EN vocabulary database\tcompiled by dict.cc\n\n')
+        for left, right in zip(_words(n, 1), _words(n, 2)):
+            fp.write('%s\t%s\tnoun\n' % (left, right))
+    database = 'sqlite:///%s' % (tmp_path / 'vortaro.sqlite')
+    index(data_dir=tmp_path, database=database, engine='native')
+    client = Vortaro(database)
+
+    timings = {}
+    for label, texts, match in (
+            ('scan', ('ab', 'qu', 'ü'), 'contains'),
+            ('trigram', ('abc', 'xyz', 'mno'), 'contains'),
+            ('prefix', ('ab', 'kl'), 'prefix'),
+            ('exact', ('abc', 'klm'), 'exact')):
+        for engine in ('sql', 'native'):
+            best = None
+            for _ in range(3):
+                start = time.perf_counter()
+                for text in texts:
+                    list(client.search(text, match=match, cache=None,
+                                       engine=engine, data_dir=tmp_path))
+                seconds = time.perf_counter() - start
+                best = seconds if best is None else min(best, seconds)
+            timings[label, engine] = best
+        print('%-8s sql %.4fs, native %.4fs' % (
+            label, timings[label, 'sql'], timings[label, 'native']))
@@ -0,0 +1,99 @@
+# vortaro
+# Copyright (C) 2017, 2018 Thomas Levine
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import vortaro
+from .. import search, Vortaro
+
+QUERIES = (
+    ('ele', (
+        ('noun', 'eo', 'elefanto', 'en', 'elephant'),
+        ('noun', 'en', 'elephant', 'eo', 'elefanto'),
+        ('noun', 'en', 'elephant', 'ru', 'слон'),
+        ('noun', 'en', 'baby elephant', 'ru', 'слонёнок'),
+    )),
+    ('ВОДА', (
+        ('noun', 'ru', 'вода', 'en', 'water'),
+        ('noun', 'ru', 'минеральная вода', 'en', 'mineral water'),
+    )),
+    ('voda', (
+        ('noun', 'ru', 'вода', 'en', 'water'),
+        ('noun', 'ru', 'минеральная вода', 'en', 'mineral water'),
+    )),
+    ('cxu', (
+        ('verb', 'eo', 'ĉu', 'en', 'if'),
+        ('verb', 'eo', 'ĉu', 'en', 'whether'),
+    )),
+    ('улица', (
+        ('noun', 'ru', 'Улица', 'en', 'street'),
+    )),
+    ('ULICA', (
+        ('noun', 'ru', 'Улица', 'en', 'street'),
+    )),
+    ('%', ()),
+    ('"w', ()),
+)
+
+@pytest.mark.parametrize('text, expected', QUERIES)
+def test_search(database, text, expected):
+    assert tuple(tuple(r) for r in search(text, database=database)) == expected
+
+@pytest.mark.parametrize('text, expected', QUERIES)
+def test_search_without_trigram_index(monkeypatch, database, text, expected):
+    observed_indexed = tuple(Vortaro(database).search(text, cache=None))
+    monkeypatch.setattr(vortaro, 'has_trigram_index', lambda session: False)
+    observed_scan = tuple(Vortaro(database).search(text, cache=None))
+    assert observed_indexed == observed_scan
+
+@pytest.mark.parametrize('match, text, from_words', (
+    ('exact', 'ELEPHANT', {'elephant'}),
+    ('exact', 'ele', set()),
+    ('exact', 'cxu', {'ĉu'}),
+    ('prefix', 'ele', {'elephant', 'elefanto'}),
+    ('prefix', 'phant', set()),
+    ('suffix', 'phant', {'elephant', 'baby elephant'}),
+    ('suffix', 'VODA', {'вода', 'минеральная вода'}),
+    ('contains', 'phan', {'elephant', 'baby elephant'}),
+    ('prefix', '\ud7ff', set()),
+    ('suffix', '\ud7ff', set()),
+))
+def test_match(database, match, text, from_words):
+    results = search(text, database=database, match=match)
+    assert {result.from_word for result in results} == from_words
+
+def test_columns(database):
+    results = list(search('ele', database=database, from_langs=['en'],
+                          columns=('from_word', 'to_word')))
+    assert results[0]._fields == ('from_word', 'to_word')
+    assert set(results) == {
+        ('elephant', 'elefanto'),
+        ('elephant', 'слон'),
+        ('baby elephant', 'слонёнок'),
+    }
+    with pytest.raises(ValueError):
+        list(search('ele', database=database, columns=('from_highlight',)))
+
+def test_threads(database):
+    client = Vortaro(database)
+    def f(text):
+        return tuple(client.search(text, cache=None))
+    texts = [text for text, _ in QUERIES] * 4
+    with ThreadPoolExecutor(4) as executor:
+        observed = list(executor.map(f, texts))
+    assert observed == [tuple(search(text, database=database)) for text in texts]
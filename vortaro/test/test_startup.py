@@ -0,0 +1,42 @@
+# vortaro
+# Copyright (C) 2017, 2018 Thomas Levine
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import re
+import subprocess
+import sys
+
+# Only indexing and downloading need these.
+LAZY = ('lxml', 'pyparsing', 'requests', 'webbrowser', 'multiprocessing')
+
+def _import_times(module):
+    '''
+    Import a module in a fresh interpreter, and return the cumulative
+    import time in seconds of each module that it imported
+    '''
+    process = subprocess.run(
+        (sys.executable, '-X', 'importtime', '-c', 'import %s' % module),
+        stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        m = re.match(r'import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)$', line)
+        if m:
+            times[m.group(3)] = int(m.group(1)) / 1e6
+    return times
+
+def test_startup():
+    times = _import_times('vortaro.ui')
+    assert not [name for name in times if name.split('.')[0] in LAZY]
+    print('vortaro.ui imported in %.3fs' % times['vortaro.ui'])
@@ -14,9 +14,15 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import random
+import time
+from collections import defaultdict
+from io import StringIO
+
 import pytest
 
-from ..transliterate import ALPHABETS
+from ..transliterate import ALPHABETS, Mapper, fold
+from .conftest import benchmark
 
 transliterations = (
     ('bg', 'общопрактикуваща лекарка', 'obštopraktikuvašta lekarka'),
@@ -31,3 +37,164 @@ def test_highlight(original_to_roman, language_code, original, roman):
         assert alphabet.to_roman(original) == roman
     else:
         assert alphabet.from_roman(roman) == original
+
+@pytest.mark.parametrize('text, folded', (
+    ('Straße', 'strasse'),
+    ('ВОДА', 'вода'),
+    ('Ĉu', 'ĉu'),
+    ('C\u0302u', 'ĉu'),
+))
+def test_fold(text, folded):
+    assert fold(text) == folded
+
+class ReferenceMapper(object):
+    '''
+    The original character-by-character transliteration, which
+    :py:class:`vortaro.transliterate.Mapper` must match exactly
+    '''
+    def __init__(self, alphabet):
+        mapping = defaultdict(dict)
+        for k, v in alphabet:
+            left, right = k if len(k) == 2 else (k, '')
+            mapping[left][right] = v
+        self._mapping = dict(mapping)
+
+    def __call__(self, word):
+        return self._transliterate(word)[0]
+
+    def align(self, word):
+        '''
+        Offsets in the transliteration after each character or pair that
+        is written, mapped to the offsets in the word after it
+        '''
+        return self._transliterate(word)[1]
+
+    def _transliterate(self, word):
+        offsets = {0: 0}
+        def emit(text, consumed):
+            output.write(text)
+            offsets[output.tell()] = consumed
+        def write(raw, letter, consumed):
+            upper = any(char.upper() == char and char.lower() != char for char in raw)
+            emit(letter.upper() if upper else letter.lower(), consumed)
+
+        buf = ''
+        input = StringIO(word)
+        output = StringIO()
+        position = 0
+        def options(x):
+            return self._mapping[x.lower()]
+        def single_char(x):
+            y = options(x)
+            try:
+                return y['']
+            except KeyError:
+                return x
+        while True:
+            char = input.read(1)
+            if char == '':
+                if buf:
+                    write(buf, single_char(buf), position)
+                break
+            position += 1
+            if buf:
+                if char.lower() in options(buf):
+                    write(buf + char, options(buf)[char.lower()], position)
+                    buf = ''
+                elif char.lower() in self._mapping:
+                    write(buf + char, single_char(buf), position - 1)
+                    buf = char
+                else:
+                    write(buf, single_char(buf), position - 1)
+                    emit(char, position)
+                    buf = ''
+            else:
+                if char.lower() not in self._mapping:
+                    emit(char, position)
+                elif 1 < len(options(char)):
+                    buf = char
+                else:
+                    emit(single_char(char), position)
+        return output.getvalue(), offsets
+
+# Characters whose case does not simply round-trip
+ODD = 'İıΣσςßẞKÅǅǆ'
+
+def _alphabets():
+    for code, alphabet in sorted(ALPHABETS.items()):
+        pairs = alphabet._alphabet
+        yield code, 'to_roman', pairs
+        yield code, 'from_roman', tuple((v, k) for k, v in pairs)
+    # A two-character key without a single-character one
+    yield 'xx', 'to_roman', (('ab', 'x'), ('b', 'y'), ('σ', 's'), ('ǆ', 'dž'))
+
+def _words(pairs, n, seed=0):
+    r = random.Random(seed)
+    chars = sorted(set(''.join(k for k, v in pairs)))
+    chars += [c.upper() for c in chars] + list(ODD) + [' ', '-', 'q', '1']
+    for _ in range(n):
+        yield ''.join(r.choice(chars) for _ in range(r.randint(0, 8)))
+
+@pytest.mark.parametrize('code, direction, pairs', tuple(_alphabets()))
+def test_reference(code, direction, pairs):
+    reference = ReferenceMapper(pairs)
+    mapper = Mapper(pairs)
+    words = list(_words(pairs, 3000))
+    for word in words:
+        assert mapper(word) == reference(word), word
+    assert mapper.many(words) == [reference(word) for word in words]
+
+@pytest.mark.parametrize('words', ([], [''], ['a\nb', 'c'], ['Ljubav', 'NJEGOŠ']))
+def test_many(words):
+    mapper = ALPHABETS['sr'].from_roman
+    assert mapper.many(words) == [mapper(word) for word in words]
+
+@pytest.mark.parametrize('code, direction, pairs', tuple(_alphabets()))
+def test_align(code, direction, pairs):
+    reference = ReferenceMapper(pairs)
+    mapper = Mapper(pairs)
+    for word in _words(pairs, 300):
+        offsets = mapper.align(word)
+        assert offsets == reference.align(word), word
+        # Each slice of the output between the offsets is the
+        # transliteration of the slice of the word between theirs, as
+        # highlighting relies on; its case can depend on the next character.
+        output = mapper(word)
+        ends = sorted(offsets)
+        assert ends[-1] == len(output)
+        for start, end in zip(ends, ends[1:]):
+            assert offsets[start] < offsets[end]
+            assert output[start:end].lower() == \
+                mapper(word[offsets[start]:offsets[end]]).lower(), word
+
+@benchmark
+def test_benchmark():
+    '''
+    Transliterate words in Bulgarian, Russian, Serbian and Esperanto both
+    ways, compared with the original implementation, taking the best of three
+    runs; run pytest with -s and VORTARO_BENCHMARK set to see the timings.
+    '''
+    for code in ('bg', 'ru', 'sr', 'eo'):
+        alphabet = ALPHABETS[code]
+        pairs = alphabet._alphabet
+        original = list(_words(pairs, 2000, seed=1))
+        roman = list(map(alphabet.to_roman, original))
+        for direction, words, reference in (
+                ('to_roman', original, ReferenceMapper(pairs)),
+                ('from_roman', roman, ReferenceMapper((v, k) for k, v in pairs))):
+            mapper = getattr(alphabet, direction)
+            timings = []
+            for f in (reference, mapper, mapper.many):
+                best = None
+                for _ in range(3):
+                    start = time.perf_counter()
+                    if f == mapper.many:
+                        f(words)
+                    else:
+                        for word in words:
+                            f(word)
+                    seconds = time.perf_counter() - start
+                    best = seconds if best is None else min(best, seconds)
+                timings.append(best)
+            print('%s %-10s reference %.4fs, compiled %.4fs, many %.4fs' % (
+                code, direction, *timings))
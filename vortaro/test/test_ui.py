@@ -0,0 +1,68 @@
+# vortaro
+# Copyright (C) 2017, 2018 Thomas Levine
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import re
+
+import pytest
+from sqlalchemy.orm import Query
+
+from .. import ui
+from ..models import SessionMaker, History
+
+ROWS = (
+    ui.Row('noun', 'en', 'ant', None, 'eo', 'formiko'),
+    ui.Row('noun', 'en', 'elephant', None, 'eo', 'elefanto'),
+    ui.Row('noun', 'en', 'a very long elephant', None, 'eo', 'elefanto'),
+)
+
+@pytest.mark.parametrize('width, expected', (
+    (0, [4, 2, 20, 2, 8]),
+    (80, [4, 2, 20, 2, 8]),
+    (30, [4, 2, 8, 2, 8]),
+))
+def test_widths(width, expected):
+    assert ui._widths(ROWS, width) == expected
+
+def test_widths_past_first_screen(monkeypatch, database):
+    monkeypatch.setattr(ui, 'ROWS', 2)
+    lines = list(ui.search('ele', 10, width=80, database=database,
+                           from_langs=['en'], nocache=True))
+    assert 'baby' in lines[2]
+    assert len({re.sub(r'\x1b\[[0-9;]*m', '', line).rindex(':')
+                for line in lines}) == 1
+
+@pytest.mark.parametrize('limit, displayed', ((1, 1), (0, 3), (10, 3)))
+def test_history(database, limit, displayed):
+    lines = list(ui.search('ele', limit, width=80, database=database,
+                           from_langs=['en']))
+    assert len(lines) == displayed
+    assert list(ui.history(database=database)) == [('ele',)]
+
+@pytest.mark.parametrize('count', (False, True))
+def test_total_results(database, count):
+    list(ui.search('ele', 1, database=database, count=count))
+    session = SessionMaker(database)
+    assert session.query(History.total_results).scalar() == 4
+
+@pytest.mark.parametrize('text', ('e', 'el'))
+def test_estimate_scan(monkeypatch, database, text):
+    # Short contains searches scan the words, so they are not counted too.
+    def count(query):
+        raise AssertionError('counted %s' % query)
+    monkeypatch.setattr(Query, 'count', count)
+    list(ui.search(text, 1, database=database, nocache=True))
+    session = SessionMaker(database)
+    assert session.query(History.total_results).scalar() > 1
@@ -14,13 +14,21 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import re
 from collections import defaultdict
+from itertools import chain
 from functools import lru_cache
 from logging import getLogger
-from io import StringIO
+from unicodedata import normalize
 
 logger = getLogger(__name__)
 
+def fold(text):
+    '''
+    Case-fold and NFC-normalize text, for comparing search keys
+    '''
+    return normalize('NFC', normalize('NFC', text).casefold())
+
 @lru_cache(None)
 def get_alphabet(code):
     return ALPHABETS.get(code, IDENTITY)
@@ -34,6 +42,19 @@ class Alphabet(object):
         return 'Alphabet(%s)' % repr(self._alphabet)
 
 class Mapper(object):
+    '''
+    Transliterate words from one alphabet to another. Keys are one or two
+    lowercase characters. A character that starts two-character keys is
+    held until the next character shows whether they form one; its output
+    is uppercase if either of them is. Characters with one transliteration
+    are otherwise written as they are in the alphabet, in lowercase, and
+    other characters are kept.
+
+    The mapping is compiled for speed. Characters outside runs of held
+    characters go through :py:meth:`str.translate`, which is all there is
+    to one-to-one alphabets; a regular expression finds the runs, and the
+    output for each run is remembered.
+    '''
     def __init__(self, alphabet):
         mapping = defaultdict(dict)
         for k, v in alphabet:
@@ -42,53 +63,186 @@ class Mapper(object):
             left, right = k if len(k) == 2 else (k, '')
             mapping[left][right] = v
         self._mapping = dict(mapping)
+        self._pairs = {left + right: v
+                       for left, options in self._mapping.items()
+                       for right, v in options.items() if right}
+        self._table = _Table(self._mapping)
+        self._runs = {}
+        if all('' in options for options in self._mapping.values()):
+            self._singles = {ord(k): options[''].lower()
+                             for k, options in self._mapping.items()}
+        else:
+            self._singles = None
+
+        # A run starts with a held character and continues through each
+        # character that does not form a pair with the one after it, up to a
+        # pair or a character that is not in the mapping.
+        keys = set(self._mapping)
+        held = [k for k, options in self._mapping.items() if 1 < len(options)]
+        if held:
+            chars = _character_class(keys)
+            continuing = []
+            for k, options in sorted(self._mapping.items()):
+                rest = keys - set(options)
+                if rest and set(options) != {''}:
+                    continuing.append('%s(?=%s)' % (re.escape(k), _character_class(rest)))
+            plain = [k for k, options in self._mapping.items() if set(options) == {''}]
+            if plain:
+                continuing.append('%s(?=%s)' % (_character_class(plain), chars))
+            self._run = re.compile('(?=%s)(?:%s)*(?:%s)' % (
+                _character_class(held),
+                '|'.join(continuing),
+                '|'.join(sorted(map(re.escape, self._pairs)) + [chars]),
+            ))
+        else:
+            self._run = None
+        self._sentinel = next(chr(i) for i in range(0x110000) if chr(i) not in keys)
 
     def __call__(self, word):
-        def write(raw, letter):
-            upper = any(char.upper() == char and char.lower() != char for char in raw)
-            output.write(letter.upper() if upper else letter.lower())
-
-        buf = ''
-        input = StringIO(word)
-        output = StringIO()
-        def options(x):
-            return self._mapping[x.lower()]
-        def single_char(x):
-            y = options(x)
-            try:
-                return y['']
-            except KeyError:
-                logger.warning(
-                    'A multi-character translateration is specified'
-                    'without a single-character transliteration,'
-                    'and you are trying to use the single-character translateration.'
-                )
-                return x
-        while True:
-            char = input.read(1)
-            if char == '':
-                if buf:
-                    write(buf, single_char(buf))
-                break
-            elif buf:
-                if char.lower() in options(buf):
-                    write(buf + char, options(buf)[char.lower()])
-                    buf = ''
-                elif char.lower() in self._mapping:
-                    write(buf + char, single_char(buf))
-                    buf = char
-                else:
-                    write(buf, single_char(buf))
-                    output.write(char)
-                    buf = ''
+        if self._run is None:
+            return word.translate(self._table)
+        output = []
+        position = 0
+        for match in self._run.finditer(self._lower(word)):
+            start, end = match.span()
+            output.append(word[position:start].translate(self._table))
+            output.append(self._run_output(word[start:end]))
+            position = end
+        output.append(word[position:].translate(self._table))
+        return ''.join(output)
+
+    def many(self, words):
+        '''
+        Transliterate a sequence of words in one pass
+
+        :rtype: list
+        '''
+        words = list(words)
+        separator = '\n'
+        joined = separator.join(words)
+        if separator in self._mapping or joined.count(separator) != len(words) - 1:
+            return list(map(self, words))
+        else:
+            return self(joined).split(separator) if words else []
+
+    def align(self, word):
+        '''
+        Find where the transliterations of the characters of a word start
+        and end in the transliteration of the word
+
+        :rtype: dict
+        :returns: Offsets in the transliteration mapped to offsets in the word
+        '''
+        lower = self._lower(word)
+        runs = self._run.finditer(lower) if self._run else ()
+        offsets = {0: 0}
+        output = 0
+        position = 0
+        for start, end in chain((run.span() for run in runs), [(len(word),) * 2]):
+            for char in word[position:start]:
+                output += len(self._table[ord(char)])
+                position += 1
+                offsets[output] = position
+            while position < end:
+                step = 2 if lower[position:position+2] in self._pairs else 1
+                output += len(self._run_output(word[position:position+step]))
+                position += step
+                offsets[output] = position
+        return offsets
+
+    def _lower(self, word):
+        '''
+        Lowercase each character on its own, keeping positions; characters
+        that lowercase to several characters are not in the mapping.
+        '''
+        lower = word.lower()
+        if len(lower) != len(word) or 'Σ' in word:
+            # Some lowercase to several characters, and str.lower
+            # treats a final capital sigma specially.
+            return ''.join(l if len(l) == 1 else self._sentinel
+                           for l in map(str.lower, word))
+        else:
+            return lower
+
+    def _run_output(self, run):
+        try:
+            return self._runs[run]
+        except KeyError:
+            pass
+        lower = self._lower(run)
+        if run == lower and self._singles is not None:
+            # Only the last two characters can be a pair.
+            if lower[-2:] in self._pairs:
+                output = lower[:-2].translate(self._singles) + \
+                    self._pairs[lower[-2:]].lower()
+            else:
+                output = lower.translate(self._singles)
+            self._remember(run, output)
+            return output
+
+        output = []
+        warned = False
+        position = 0
+        while position < len(run):
+            pair = lower[position:position+2]
+            if pair in self._pairs:
+                output.append(_case(run[position:position+2], self._pairs[pair]))
+                position += 2
             else:
-                if char.lower() not in self._mapping:
-                    output.write(char)
-                elif 1 < len(options(char)):
-                    buf = char
+                options = self._mapping[lower[position]]
+                if '' in options:
+                    letter = options['']
                 else:
-                    output.write(single_char(char))
-        return output.getvalue()
+                    _warn()
+                    warned = True
+                    letter = run[position]
+                # The case depends on the next character too.
+                output.append(_case(run[position:position+2], letter))
+                position += 1
+        output = ''.join(output)
+        if not warned:
+            self._remember(run, output)
+        return output
+
+    def _remember(self, run, output):
+        if len(self._runs) > RUNS:
+            self._runs.clear()
+        self._runs[run] = output
+
+RUNS = 100000
+
+class _Table(dict):
+    '''
+    :py:meth:`str.translate` table for characters outside runs, filled in
+    as characters are seen
+    '''
+    def __init__(self, mapping):
+        self._mapping = mapping
+    def __missing__(self, ordinal):
+        char = chr(ordinal)
+        options = self._mapping.get(char.lower())
+        if options is None:
+            self[ordinal] = char
+        elif '' in options:
+            self[ordinal] = options['']
+        else:
+            _warn()
+            return char
+        return self[ordinal]
+
+def _case(raw, letter):
+    upper = any(char.upper() == char and char.lower() != char for char in raw)
+    return letter.upper() if upper else letter.lower()
+
+def _character_class(chars):
+    return '[%s]' % ''.join(re.escape(char) for char in sorted(chars))
+
+def _warn():
+    logger.warning(
+        'A multi-character translateration is specified'
+        'without a single-character transliteration,'
+        'and you are trying to use the single-character translateration.'
+    )
 
 IDENTITY = Alphabet(())
 ALPHABETS = dict(
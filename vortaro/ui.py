@@ -14,107 +14,208 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from collections import namedtuple
+from functools import lru_cache
+from heapq import nsmallest
+from itertools import islice
 from logging import getLogger
 from pathlib import Path
 
 import horetu
-from sqlalchemy.sql import func, desc
+from sqlalchemy.sql import desc
 
-from .models import SessionMaker, History, PartOfSpeech, Dictionary
-from .highlight import bold, quiet, HIGHLIGHT_COUNT, QUIET_COUNT
+from .models import History, PartOfSpeech
+from .cache import Cache
+from .highlight import highlight, bold, quiet, HIGHLIGHT_COUNT, QUIET_COUNT
 from . import (
     DATA,
     download, index, languages,
-    _search_query, DATABASE, ROWS, COLUMNS, Word,
+    _client, _estimate, _cache_key, _order_by, _sort_key,
+    DATABASE, ROWS, COLUMNS, MATCHES, ENGINES,
+    Word,
 )
 
 logger = getLogger(__name__)
 
+Row = namedtuple('Row', (
+    'part_of_speech', 'from_lang', 'from_word', 'from_roman', 'to_lang', 'to_word',
+))
+
+@lru_cache(None)
+def _cache(data_dir):
+    '''
+    The result cache in a data directory, which the command line program
+    keeps between runs
+    '''
+    return Cache(path=data_dir / 'cache.sqlite')
+
+# Order of the results, as in vortaro.SEARCH_ORDER
+ORDER = ('from_length', 'from_word', 'length', 'part_of_speech', 'to_word')
+_order = _sort_key(ORDER)
+
 def search(text: Word, limit: int=ROWS-2, *,
         width: int=COLUMNS, database=DATABASE,
-        from_langs: [str]=(), to_langs: [str]=()):
+        from_langs: [str]=(), to_langs: [str]=(), match: MATCHES='contains',
+        count=False, nocache=False, engine: ENGINES='sql', data_dir: Path=DATA):
     '''
     Search for a word in the dictionaries.
 
     :param text: The word/fragment you are searching for
     :param limit: Maximum number of words to return
+    :param count: Count all of the results for the history, rather than
+        estimating how many there are
+    :param nocache: Neither read nor save results in the cache
     :param from_langs: Languages the word is in, defaults to all
     :param to_langs: Languages to look for translations, defaults to all
+    :param match: Whether words should contain the text, equal it,
+        start with it (prefix), or end with it (suffix)
+    :param engine: 'sql' to search the database, or 'native' to search the
+        native search file that ``index -engine native`` writes instead;
+        native searches always count their results and are not cached.
+    :param pathlib.path data_dir: Vortaro data directory, for the native
+        search file and the result cache
     :param database: SQLAlchemy database URL
     '''
-    session = SessionMaker(database)
+    if engine not in ENGINES:
+        raise ValueError('engine must be one of: %s' % ', '.join(ENGINES))
+    client = _client(database)
+    if engine == 'native':
+        rows = list(client.native_search(data_dir, from_langs, to_langs, text, match))
+        total = len(rows)
+        if limit > 0:
+            rows = nsmallest(limit, rows, key=_order)
+        else:
+            rows.sort(key=_order)
+        yield from _lines([Row._make(row) for row in rows], text, width)
+        _history(client, text, total, len(rows))
+        return
 
-    q_all, FromLanguage, ToLanguage = \
-        _search_query(session, from_langs, to_langs, text)
+    with client.session('serve') as session:
+        if limit > 0:
+            key = _cache_key(session, 'ui.search', text, from_langs, to_langs,
+                             match, limit, count)
+            cache = _cache(data_dir)
+            cached = None if nocache else cache.get(key)
+            if cached is None:
+                q_all, q_main = _queries(client, session,
+                                         from_langs, to_langs, text, match)
+                rows = [tuple(row) for row in q_main.limit(limit)]
+                if len(rows) < limit:
+                    total = len(rows)
+                elif count:
+                    total = q_all.count()
+                else:
+                    total = max(len(rows), _estimate(
+                        session, q_all, text, match,
+                        client.has_trigram_index(session), from_langs, to_langs))
+                if not nocache:
+                    cache.set(key, (rows, total))
+            else:
+                rows, total = cached
+            displayed = len(rows)
+            yield from _lines([Row._make(row) for row in rows], text, width)
+        else:
+            q_all, q_main = _queries(client, session,
+                                     from_langs, to_langs, text, match)
+            displayed = 0
+            for line in _lines(map(Row._make, q_main), text, width):
+                displayed += 1
+                yield line
+            total = displayed
+    _history(client, text, total, displayed)
+
+def _history(client, text, total, displayed):
+    with client.session() as session:
+        session.add(History(
+            text=text,
+            total_results=total,
+            displayed_results=displayed,
+        ))
+        session.commit()
+
+def _queries(client, session, from_langs, to_langs, text, match):
+    q_all, Definition, FromLanguage, ToLanguage = \
+        client.search_query(session, from_langs, to_langs, text, match)
     q_main = q_all \
-        .join(PartOfSpeech, Dictionary.part_of_speech_id == PartOfSpeech.id) \
-        .order_by(
-            Dictionary.from_length,
-            Dictionary.from_word,
-            Dictionary.from_length + Dictionary.to_length,
-            PartOfSpeech.text,
-            Dictionary.to_word,
-       #    FromLanguage.code,
-       #    ToLanguage.code,
-       )
-    if limit > 0:
-        q_main = q_main.limit(limit)
-
-    # Determine column widths
-    meta_tpl = '%%-0%ds\t%%0%ds:%%-0%ds\t%%0%ds:%%s'
-    q_lengths = q_main.from_self() \
-        .join(PartOfSpeech, Dictionary.part_of_speech_id == PartOfSpeech.id) \
+        .join(PartOfSpeech, Definition.c.part_of_speech_id == PartOfSpeech.id) \
+        .order_by(*_order_by(ORDER, Definition)) \
         .with_entities(
-            func.max(PartOfSpeech.length),
-            func.max(FromLanguage.length),
-            func.max(Dictionary.from_length),
-            func.max(ToLanguage.length),
-            func.max(Dictionary.to_length),
+            PartOfSpeech.text,
+            FromLanguage.code,
+            Definition.c.from_original,
+            Definition.c.from_roman_transliteration,
+            ToLanguage.code,
+            Definition.c.to_word,
         )
-    row = list(q_lengths.one())
-    if any(row):
-        # Check for long lines.
-        actual_width = sum(row)
-        available_width = width - actual_width
-        if available_width < 0 < width:
-            left = row[2]
-            right = row[4]
-            if left > right:
-                # TODO: This could be chosen more smartly based on word length
-                # distribution so that the white space is likely to be closed
-                # for most words.
-                diff = func.lead(Dictionary.from_length, 1, 0).over() \
-                    - Dictionary.from_length
-                row[2] = q_main.from_self() \
-                    .with_entities(Dictionary.from_length) \
-                    .order_by(desc(diff)).limit(1).scalar()
-
-        # Adjust for formatting.
-        for i in (0, 1, 3):
-            row[i] += QUIET_COUNT
-        row[2] += HIGHLIGHT_COUNT
-        del(row[4])
-
-        tpl_line = (meta_tpl % tuple(row)).replace('\t', '  ')
-        for definition in q_main:
-            line = (tpl_line % (
-                quiet(definition.part_of_speech.text),
-                quiet(definition.from_lang.code),
-                definition.from_highlight(text),
-                quiet(definition.to_lang.code),
-                bold(definition.to_word),
-            ))
-            # Remove the white space if POS is empty.
-            if row[0] == 0:
-                line = line[2:]
-            yield line
-
-    session.add(History(
-        text=text,
-        total_results=q_all.count(),
-        displayed_results=limit,
-    ))
-    session.commit()
+    return q_all, q_main
+
+def _lines(rows, text, width):
+    '''
+    Format result rows as lines, with column widths to fit the rows.
+    If rows is a list, the widths fit all of them; if it is an iterator,
+    lay out the first screen of rows and widen columns for later rows as
+    they arrive.
+    '''
+    if isinstance(rows, list):
+        head, rows = rows, ()
+    else:
+        rows = iter(rows)
+        head = list(islice(rows, ROWS))
+    if not head:
+        return
+    widths = _widths(head, width)
+    for row in head:
+        yield _line(widths, row, text)
+    for row in rows:
+        widths = _widen(widths, row, width)
+        yield _line(widths, row, text)
+
+def _widths(rows, width):
+    '''
+    Widths of the part-of-speech, from-language, from-word, to-language and
+    to-word columns. If the lines would be too wide and the from-words are
+    longer than the to-words, the from-word column is narrowed to just
+    before the largest jump in from-word length.
+    '''
+    widths = [max(len(row[i]) for row in rows) for i in (0, 1, 2, 4, 5)]
+    if 0 < width < sum(widths) and widths[2] > widths[4]:
+        # Rows are sorted by from-word length.
+        lengths = [len(row.from_word) for row in rows]
+        jumps = [b - a for a, b in zip(lengths, lengths[1:] + [0])]
+        widths[2] = lengths[jumps.index(max(jumps))]
+    return widths
+
+def _widen(widths, row, width):
+    new = [max(w, len(row[i])) for w, i in zip(widths, (0, 1, 2, 4, 5))]
+    if width <= 0 or sum(new) <= width:
+        return new
+    else:
+        # Let the long from-word overflow rather than push every later line.
+        new[2] = widths[2]
+        return new
+
+@lru_cache(None)
+def _template(pos, from_lang, from_word, to_lang):
+    tpl = '%%-0%ds\t%%0%ds:%%-0%ds\t%%0%ds:%%s' % (
+        pos + QUIET_COUNT,
+        from_lang + QUIET_COUNT,
+        from_word + HIGHLIGHT_COUNT,
+        to_lang + QUIET_COUNT,
+    )
+    return tpl.replace('\t', '  ')
+
+def _line(widths, row, text):
+    line = _template(*widths[:4]) % (
+        quiet(row.part_of_speech),
+        quiet(row.from_lang),
+        highlight(row.from_lang, row.from_word, row.from_roman or row.from_word, text),
+        quiet(row.to_lang),
+        bold(row.to_word),
+    )
+    # Remove the white space if POS is empty.
+    if widths[0] == 0:
+        line = line[2:]
+    return line
 
 def history(limit: int=None, *, nodeduplicate=False, database=DATABASE):
     '''
@@ -122,14 +223,27 @@ def history(limit: int=None, *, nodeduplicate=False, database=DATABASE):
     :param database: SQLAlchemy database URL.
     :param nodeduplicate: Show adjacent duplicate searches.
     '''
-    session = SessionMaker(database)
-    q = session.query(History.text) \
-        .order_by(desc(History.datetime)).limit(limit)
-    prev = None
-    for cur in q:
-        if nodeduplicate or cur != prev:
-            prev = cur
-            yield cur
+    with _client(database).session('serve') as session:
+        q = session.query(History.text) \
+            .order_by(desc(History.datetime)).limit(limit)
+        prev = None
+        for cur in q:
+            if nodeduplicate or cur != prev:
+                prev = cur
+                yield cur
+
+def cache(*, clear=False, data_dir: Path=DATA):
+    '''
+    Show how often searches have been answered from the cache.
+
+    :param clear: Empty the cache and reset the counts.
+    :param pathlib.path data_dir: Vortaro data directory, where the cache is
+    '''
+    if clear:
+        _cache(data_dir).clear()
+    info = _cache(data_dir).info()
+    for field in info._fields:
+        yield '%s\t%d' % (field, getattr(info, field))
 
 def ui():
     config_name = 'config'
@@ -147,5 +261,6 @@ def ui():
         download,
         search,
         history,
+        cache,
     ], str(DATA / config_name), name='vortaro')
     horetu.cli(program)